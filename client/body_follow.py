@@ -7,7 +7,9 @@ from pathlib import Path
 import yaml
 import aiohttp
 import chase
-from config import (CAMERA_SERVER_URL, DETECTION_SERVER_URL, DETECTION_MAX_AGE_MS)
+import detection_codec
+from config import (CAMERA_SERVER_URL, DETECTION_SERVER_URL, DETECTION_MAX_AGE_MS,
+                    DETECTION_BINARY)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -73,17 +75,25 @@ async def run(targets: list):
     logger.info(f"Logging to {yolo_dir}/detections.jsonl")
 
     target_map = {t['name']: t for t in targets}
+    detection_headers = {'Accept': detection_codec.MEDIA_TYPE} if DETECTION_BINARY else {}
 
     async with aiohttp.ClientSession() as session:
         try:
             while True:
                 # Fetch latest detection and cliff status concurrently
                 try:
-                    async with session.get(f"{DETECTION_SERVER_URL}/detection") as resp:
+                    async with session.get(f"{DETECTION_SERVER_URL}/detection",
+                                           headers=detection_headers) as resp:
                         if resp.status != 200:
                             await asyncio.sleep(0.1)
                             continue
-                        det_result = await resp.json()
+                        if resp.content_type == detection_codec.MEDIA_TYPE:
+                            decoded = detection_codec.decode(await resp.read())
+                            det_result = {'timestamp': decoded.timestamp,
+                                          'frame_ts': decoded.frame_ts,
+                                          'detections': detection_codec.to_dicts(decoded)}
+                        else:
+                            det_result = await resp.json()
                 except Exception as e:
                     logger.warning(f"Detection server fetch failed: {e}")
                     await asyncio.sleep(0.1)
@@ -42,3 +42,18 @@ DETECTION_SERVER_URL = 'http://localhost:8090'
 
 # Detection server
 DETECTION_MAX_AGE_MS = 1000     # Discard result older than this → treat as no detection
+DETECTION_RAW_FRAMES = True     # Pass raw BGR camera → YOLO (skips JPEG decode/re-decode)
+DETECTION_FRAME_RING = 'rover_frames'  # camera_server shared-memory frame ring (same host):
+                                       # YOLO maps the frame, no frame HTTP at all; falls back
+                                       # to HTTP when the ring is absent. None = HTTP only
+DETECTION_TARGET_CLASSES_ONLY = False  # YOLO reports only targets.yaml labels (non-target
+                                       # obstacles then no longer feed min_distance)
+DETECTION_ROI_ENABLED = False   # Track last target: YOLO on a crop around it at reduced size
+DETECTION_ROI_SIZE = 320        # YOLO input size for ROI frames (needs yolo_server --size-model)
+DETECTION_ROI_MARGIN = 0.5      # Crop grows by this fraction of the bbox on each side
+DETECTION_ROI_FULL_EVERY = 10   # Full-frame inference at least every N frames (new obstacles)
+DETECTION_SEARCH_BUDGET_MS = None  # No target: let YOLO pick the input size fitting this
+                                   # forward budget (e.g. 25 → 320 on CPU); None = always 640
+DETECTION_SMALL_TARGET_PX = 60  # Tracked target smaller than this (far) → force 640 input
+DETECTION_BINARY = True        # Binary detection results (client/detection_codec.py) for
+                                # YOLO → detection server and detection server → body_follow
@@ -0,0 +1,120 @@
+"""Compact binary wire format for detection results.
+
+Served by yolo_server (/detect/, /detect/raw, /detect/shm) and
+detection_server (/detection) when the request sends
+``Accept: application/x-detections``; JSON stays the default.
+
+Layout (little-endian):
+    header   magic b'DET2', u8 n_labels, u8 reserved, u16 n_detections,
+             u16 input_size, f64 timestamp, f64 processing_time
+    frame_ts u8 length + UTF-8
+    labels   n_labels x (u8 length + UTF-8), indexed by label_id
+    records  n_detections x DETECTION_DTYPE (36 bytes each)
+
+input_size is the network input side yolo_server ran at (0 when not
+known, e.g. detection_server's /detection); DET1 payloads, which lack it,
+still decode with input_size 0. The JSON-only response fields are roi
+(the caller chose it), cached and timings: yolo_server sends stage
+timings, including a "cache" stage for cache hits, in the Server-Timing
+header of either format.
+
+Fields that do not apply (distance without depth, bearing/centroid in
+yolo_server responses) are NaN. decode() returns the records as a numpy
+structured array, so clients read columns without building a dict per
+detection. Kept Python 3.6 compatible for yolo_server.
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MEDIA_TYPE = 'application/x-detections'
+MAGIC = b'DET2'
+MAGIC_V1 = b'DET1'
+
+_HEADER = struct.Struct('<4sBBHHdd')
+_HEADER_V1 = struct.Struct('<4sBBHdd')   # DET1: no input_size
+
+DETECTION_DTYPE = np.dtype([
+    ('label_id', '<u2'),
+    ('reserved', '<u2'),
+    ('confidence', '<f4'),
+    ('bbox', '<i4', (4,)),            # x, y, w, h pixels
+    ('centroid_x_norm', '<f4'),
+    ('distance', '<f4'),              # meters
+    ('relative_position_deg', '<f4'),
+])
+
+Decoded = namedtuple('Decoded', 'timestamp processing_time frame_ts labels records input_size')
+
+
+def wants_binary(accept_header):
+    """True if an Accept header asks for the binary format."""
+    return MEDIA_TYPE in (accept_header or '')
+
+
+def _pack_str(value):
+    data = value.encode('utf-8')[:255]
+    return struct.pack('<B', len(data)) + data
+
+
+def encode(detections, timestamp=0.0, processing_time=0.0, frame_ts='', input_size=0):
+    """Encode an iterable of detection dicts (label, confidence, bbox and
+    optionally centroid_x_norm, distance, relative_position_deg)."""
+    detections = list(detections)
+    records = np.zeros(len(detections), DETECTION_DTYPE)
+    labels = []
+    label_ids = {}
+    nan = float('nan')
+    for i, d in enumerate(detections):
+        label = d['label']
+        if label not in label_ids:
+            label_ids[label] = len(labels)
+            labels.append(label)
+        centroid = d.get('centroid_x_norm')
+        distance = d.get('distance')
+        bearing = d.get('relative_position_deg')
+        records[i] = (label_ids[label], 0, d['confidence'], d['bbox'],
+                      nan if centroid is None else centroid,
+                      nan if distance is None else distance,
+                      nan if bearing is None else bearing)
+    parts = [_HEADER.pack(MAGIC, len(labels), 0, len(detections), input_size,
+                          timestamp, processing_time),
+             _pack_str(frame_ts)]
+    parts.extend(_pack_str(label) for label in labels)
+    parts.append(records.tobytes())
+    return b''.join(parts)
+
+
+def decode(payload):
+    """Parse a binary payload into a Decoded tuple (records: structured array)."""
+    magic = bytes(payload[:4])
+    if magic == MAGIC:
+        _, n_labels, _, count, input_size, timestamp, processing_time = \
+            _HEADER.unpack_from(payload, 0)
+        offset = _HEADER.size
+    elif magic == MAGIC_V1:
+        _, n_labels, _, count, timestamp, processing_time = _HEADER_V1.unpack_from(payload, 0)
+        input_size = 0
+        offset = _HEADER_V1.size
+    else:
+        raise ValueError('Not a detections payload')
+    strings = []
+    for _ in range(n_labels + 1):
+        length = payload[offset]
+        strings.append(bytes(payload[offset + 1:offset + 1 + length]).decode('utf-8'))
+        offset += 1 + length
+    records = np.frombuffer(payload, DETECTION_DTYPE, count=count, offset=offset)
+    return Decoded(timestamp, processing_time, strings[0], strings[1:], records, input_size)
+
+
+def to_dicts(decoded):
+    """Detection dicts as in the JSON responses (for logging); NaN becomes None."""
+    records = decoded.records
+    columns = [[None if v != v else v for v in records[key].tolist()]
+               for key in ('centroid_x_norm', 'distance', 'relative_position_deg')]
+    return [{'label': decoded.labels[label_id], 'confidence': confidence, 'bbox': bbox,
+             'centroid_x_norm': centroid, 'distance': distance, 'relative_position_deg': bearing}
+            for label_id, confidence, bbox, centroid, distance, bearing
+            in zip(records['label_id'].tolist(), records['confidence'].tolist(),
+                   records['bbox'].tolist(), *columns)]
@@ -0,0 +1,209 @@
+"""Shared-memory ring of the latest camera frames.
+
+camera_server publishes every captured color (BGR) and depth (uint16)
+frame into a fixed number of slots of one shared-memory segment
+(/dev/shm/<name>). Readers (detection_server, yolo_server /detect/shm)
+map the same segment and get numpy views of a slot, so a frame reaches
+inference without HTTP or JPEG in between.
+
+Layout (little-endian, every block 64-byte aligned):
+    header  HEADER_DTYPE (magic, slot count and size, frame shapes,
+            depth scale, latest sequence number)
+    slots   n_slots x (SLOT_DTYPE header + color bytes + depth bytes)
+
+Frame n (sequence numbers start at 1) lives in slot n % n_slots. The
+writer stamps seq_begin before overwriting a slot and seq_end after, and
+bumps latest last. A reader whose slot has seq_begin == seq_end == n has
+an intact frame; a view stays valid until the writer comes round to the
+slot again (n_slots frames later), which intact() checks.
+
+Readers open /dev/shm directly instead of multiprocessing.shared_memory:
+it works on Python 3.6 (yolo_server) and keeps the 3.8 resource tracker
+from unlinking the camera's segment when a reader exits. Only the writer
+needs Python 3.8+.
+"""
+import mmap
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_NAME = 'rover_frames'
+DEFAULT_SLOTS = 4
+SHM_DIR = '/dev/shm'
+MAGIC = b'FRM1'
+
+_ALIGN = 64
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('n_slots', '<u4'),
+    ('slot_size', '<u8'),
+    ('color_shape', '<u4', (3,)),
+    ('depth_shape', '<u4', (2,)),
+    ('depth_scale', '<f8'),
+    ('latest', '<u8'),
+])
+SLOT_HEADER_SIZE = 64
+SLOT_DTYPE = np.dtype([
+    ('seq_begin', '<u8'),
+    ('seq_end', '<u8'),
+    ('time', '<f8'),                  # time.time() at capture
+    ('timestamp', 'S32'),             # camera timestamp string (file stem)
+])
+
+Frame = namedtuple('Frame', 'seq time timestamp color depth')
+
+
+def _aligned(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(color_shape, depth_shape):
+    """(color bytes, depth offset in slot, slot size)."""
+    color_bytes = int(np.prod(color_shape))
+    depth_offset = SLOT_HEADER_SIZE + _aligned(color_bytes)
+    return color_bytes, depth_offset, _aligned(depth_offset + int(np.prod(depth_shape)) * 2)
+
+
+class _Ring:
+    """Header and per-slot views over a mapped segment."""
+
+    def _attach(self, buf):
+        self.header = np.ndarray((), HEADER_DTYPE, buf, 0)
+        if self.header['magic'].item() != MAGIC:
+            raise ValueError('Not a frame ring segment')
+        self.n_slots = int(self.header['n_slots'])
+        self.color_shape = tuple(int(v) for v in self.header['color_shape'])
+        self.depth_shape = tuple(int(v) for v in self.header['depth_shape'])
+        self.depth_scale = float(self.header['depth_scale'])
+        slot_size = int(self.header['slot_size'])
+        color_bytes, depth_offset, _ = _layout(self.color_shape, self.depth_shape)
+        self.slots = []
+        for i in range(self.n_slots):
+            base = HEADER_SIZE + i * slot_size
+            self.slots.append((
+                np.ndarray((), SLOT_DTYPE, buf, base),
+                np.ndarray(self.color_shape, np.uint8, buf, base + SLOT_HEADER_SIZE),
+                np.ndarray(self.depth_shape, np.uint16, buf, base + depth_offset),
+            ))
+
+
+class FrameRingWriter(_Ring):
+    """Owner side, used by camera_server. Creates (and finally unlinks) the segment."""
+
+    def __init__(self, name, color_shape, depth_shape, n_slots=DEFAULT_SLOTS, depth_scale=0.0):
+        from multiprocessing import shared_memory
+        _, _, slot_size = _layout(color_shape, depth_shape)
+        size = HEADER_SIZE + n_slots * slot_size
+        try:
+            # Left behind by a camera_server that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = name
+        header = np.ndarray((), HEADER_DTYPE, self.shm.buf, 0)
+        header['n_slots'] = n_slots
+        header['slot_size'] = slot_size
+        header['color_shape'] = color_shape
+        header['depth_shape'] = depth_shape
+        header['depth_scale'] = depth_scale
+        header['latest'] = 0
+        header['magic'] = MAGIC
+        self._attach(self.shm.buf)
+
+    def publish(self, color, depth, timestamp=''):
+        """Copy a frame into the next slot; returns its sequence number."""
+        seq = int(self.header['latest']) + 1
+        slot, color_view, depth_view = self.slots[seq % self.n_slots]
+        slot['seq_begin'] = seq
+        color_view[...] = color
+        depth_view[...] = depth
+        slot['time'] = time.time()
+        slot['timestamp'] = timestamp.encode()
+        slot['seq_end'] = seq
+        self.header['latest'] = seq
+        return seq
+
+    def close(self):
+        # Views must go before the buffer can be released
+        self.header = None
+        self.slots = []
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRingReader(_Ring):
+    """Read side. Maps the segment lazily and re-maps it when camera_server restarts.
+
+    Frames returned by latest()/get() are views into the ring: use them
+    (or copy what you need) before the writer laps the slot, and call
+    intact() afterwards if a torn frame would matter.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, shm_dir=SHM_DIR):
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError('Invalid frame ring name: {!r}'.format(name))
+        self.name = name
+        self.path = os.path.join(shm_dir, name)
+        self._inode = None
+        self._map = None
+
+    def _mapped(self):
+        """True once the current segment is mapped (re-mapped after a camera restart)."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            self._inode = None
+            return False
+        if inode != self._inode:
+            try:
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._attach(self._map)
+            except (OSError, ValueError):
+                return False  # Writer still sizing the segment or writing the header
+            self._inode = inode
+        return True
+
+    def available(self):
+        """True if the segment exists and can be mapped (camera_server is publishing)."""
+        return self._mapped()
+
+    def get(self, seq):
+        """Frame seq if it is still in the ring, else None."""
+        # Re-checked on every call: a reader that only calls get() (yolo_server)
+        # must also follow a camera_server restart to the new segment
+        if not self._mapped():
+            return None
+        return self._get(seq)
+
+    def _get(self, seq):
+        slot, color, depth = self.slots[seq % self.n_slots]
+        if int(slot['seq_end']) != seq or int(slot['seq_begin']) != seq:
+            return None
+        return Frame(seq, float(slot['time']), slot['timestamp'].item().decode(), color, depth)
+
+    def latest(self):
+        """Most recent intact frame, or None when the camera is not publishing."""
+        if not self._mapped():
+            return None
+        seq = int(self.header['latest'])
+        # The newest slot can be mid-write if the writer lapped us; step back
+        for candidate in range(seq, max(seq - self.n_slots, 0), -1):
+            frame = self._get(candidate)
+            if frame is not None:
+                return frame
+        return None
+
+    def intact(self, frame):
+        """True if the writer has not started overwriting frame's slot since it was read."""
+        slot = self.slots[frame.seq % self.n_slots][0]
+        return int(slot['seq_begin']) == frame.seq
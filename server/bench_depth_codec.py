@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Compare depth codecs (depth_codec.py) on a session's depth frames.
+
+For each codec: compression ratio vs raw uint16, size per frame, encode
+and decode time per frame, and the largest error in depth units (0 for
+lossless codecs). Run it on the Jetson to pick camera_server
+--depth-codec: the writer thread must encode (plus JPEG) within the
+frame interval, ~16 ms at 60 fps.
+
+Usage:
+    python3 bench_depth_codec.py sessions/20260405_115449
+    python3 bench_depth_codec.py sessions/20260405_115449 --codec delta-zlib:5 --codec delta-zstd:10
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import depth_codec
+import frame_pack
+
+
+def bench(codec, frames):
+    """(ratio, avg bytes, encode ms list, decode ms list, max abs error)."""
+    raw = encoded = 0
+    encode_ms, decode_ms = [], []
+    max_err = 0
+    for depth in frames:
+        t0 = time.perf_counter()
+        data = codec.encode(depth)
+        t1 = time.perf_counter()
+        decoded = depth_codec.decode(data)
+        t2 = time.perf_counter()
+        encode_ms.append((t1 - t0) * 1000.0)
+        decode_ms.append((t2 - t1) * 1000.0)
+        raw += depth.nbytes
+        encoded += len(data)
+        max_err = max(max_err, int(np.abs(decoded.astype(np.int32) - depth).max()))
+    return raw / encoded, encoded / len(frames), encode_ms, decode_ms, max_err
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark depth codecs on session frames")
+    parser.add_argument("session", type=str, help="Session directory with depth/ frames")
+    parser.add_argument("--codec", action="append", default=[], metavar="SPEC",
+                        help="Codec spec to test (repeatable; default: every installed "
+                             "lossless codec plus delta-zlib:5 and delta-zlib:10)")
+    parser.add_argument("--limit", type=int, default=200, help="Max frames (default: 200)")
+    args = parser.parse_args()
+
+    sources = frame_pack.list_frames(Path(args.session) / "depth", depth_codec.SUFFIXES)
+    frames = []
+    for _, source in sources[:args.limit]:
+        try:
+            frames.append(depth_codec.decode(frame_pack.read_bytes(source)))
+        except ValueError:
+            continue  # truncated frame from an interrupted recording
+    if not frames:
+        sys.exit(f"No depth frames in {args.session}/depth")
+
+    specs = args.codec or depth_codec.available() + ["delta-zlib:5", "delta-zlib:10"]
+    missing = sorted(set(depth_codec.CODECS) - set(depth_codec.available()))
+    print(f"Frames: {len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]})"
+          f"{'  not installed: ' + ', '.join(missing) if missing else ''}")
+    print(f"{'codec':<16} {'ratio':>6} {'KB/frame':>9} {'enc ms':>7} {'enc p95':>8} "
+          f"{'dec ms':>7} {'max err':>8}")
+    for spec in specs:
+        try:
+            codec = depth_codec.DepthCodec(spec)
+        except (ValueError, ImportError) as e:
+            print(f"{spec:<16} skipped: {e}")
+            continue
+        ratio, size, enc, dec, err = bench(codec, frames)
+        print(f"{spec:<16} {ratio:6.2f} {size / 1000:9.1f} {np.mean(enc):7.2f} "
+              f"{np.percentile(enc, 95):8.2f} {np.mean(dec):7.2f} {err:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Compare depth_stats.py with the masked-copy numpy code it replaced.
+
+Runs each depth statistic the camera and compose_video compute, the old
+way (region[region > 0] then np.median / np.percentile) and through
+depth_stats.DepthHistogram, on a session's depth frames. Reports time per
+call for both and the largest difference in results (should be 0).
+
+  cliff      bottom CLIFF_BOTTOM_FRAC rows: valid fraction + median
+  distance   centred boxes of --box fraction of the frame: median
+  heatmap    whole frame: p5/p95
+  bbox       same boxes: mesh depth_pct_near/far (5/95)
+
+Usage:
+    python3 bench_depth_stats.py sessions/20260405_115449
+    python3 bench_depth_stats.py sessions/20260405_115449 --box 0.1 --box 0.5 --repeat 20
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import depth_codec
+import depth_stats
+import frame_pack
+
+CLIFF_BOTTOM_FRAC = 0.30  # camera_server.CLIFF_BOTTOM_FRAC (importing it needs pyrealsense2)
+
+
+def centred_box(depth, frac):
+    h, w = depth.shape
+    bh, bw = max(1, int(h * frac)), max(1, int(w * frac))
+    y, x = (h - bh) // 2, (w - bw) // 2
+    return depth[y:y + bh, x:x + bw]
+
+
+def cliff_region(depth):
+    return depth[int(depth.shape[0] * (1.0 - CLIFF_BOTTOM_FRAC)):, :]
+
+
+def numpy_cliff(region):
+    valid = region[region > 0]
+    return [len(valid) / region.size, float(np.median(valid)) if len(valid) else np.nan]
+
+
+def hist_cliff(region):
+    hist = depth_stats.DepthHistogram(region)
+    median = hist.median()
+    return [hist.valid_fraction(), np.nan if median is None else median]
+
+
+def numpy_median(region):
+    valid = region[region > 0]
+    return [float(np.median(valid)) if len(valid) else np.nan]
+
+
+def hist_median(region):
+    median = depth_stats.valid_median(region)
+    return [np.nan if median is None else median]
+
+
+def numpy_percentiles(region):
+    valid = region[region > 0]
+    return list(np.percentile(valid, [5, 95])) if len(valid) else [np.nan, np.nan]
+
+
+def hist_percentiles(region):
+    hist = depth_stats.DepthHistogram(region)
+    return list(hist.percentile([5, 95])) if hist.valid else [np.nan, np.nan]
+
+
+def timed(fn, regions, repeat):
+    """(results per region, mean ms per call)."""
+    results = [fn(region) for region in regions]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for region in regions:
+            fn(region)
+    return results, (time.perf_counter() - t0) * 1000.0 / (repeat * len(regions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark histogram depth statistics")
+    parser.add_argument("session", type=str, help="Session directory with depth/ frames")
+    parser.add_argument("--box", action="append", type=float, default=[], metavar="FRAC",
+                        help="Box side as a fraction of the frame (repeatable; default: 0.1 0.25 0.5)")
+    parser.add_argument("--limit", type=int, default=100, help="Max frames (default: 100)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes (default: 5)")
+    args = parser.parse_args()
+
+    sources = frame_pack.list_frames(Path(args.session) / "depth", depth_codec.SUFFIXES)
+    frames = []
+    for _, source in sources[:args.limit]:
+        try:
+            frames.append(depth_codec.decode(frame_pack.read_bytes(source)))
+        except ValueError:
+            continue  # truncated frame from an interrupted recording
+    if not frames:
+        sys.exit(f"No depth frames in {args.session}/depth")
+
+    cases = [("cliff", [cliff_region(d) for d in frames], numpy_cliff, hist_cliff),
+             ("heatmap", frames, numpy_percentiles, hist_percentiles)]
+    for frac in args.box or [0.1, 0.25, 0.5]:
+        boxes = [centred_box(d, frac) for d in frames]
+        cases.append((f"distance {frac:g}", boxes, numpy_median, hist_median))
+        cases.append((f"bbox {frac:g}", boxes, numpy_percentiles, hist_percentiles))
+
+    print(f"Frames: {len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]}), "
+          f"{args.repeat} passes")
+    print(f"{'statistic':<16} {'pixels':>8} {'numpy ms':>9} {'hist ms':>8} {'speedup':>8} {'max diff':>9}")
+    for name, regions, numpy_fn, hist_fn in cases:
+        expected, numpy_ms = timed(numpy_fn, regions, args.repeat)
+        got, hist_ms = timed(hist_fn, regions, args.repeat)
+        # No valid pixels is NaN on both sides; -1 makes a one-sided NaN show up
+        max_diff = float(np.abs(np.nan_to_num(np.array(got, dtype=np.float64), nan=-1.0)
+                                - np.nan_to_num(np.array(expected, dtype=np.float64), nan=-1.0)).max())
+        print(f"{name:<16} {regions[0].size:8d} {numpy_ms:9.3f} {hist_ms:8.3f} "
+              f"{numpy_ms / hist_ms:7.1f}x {max_diff:9.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Benchmark YOLOv5 post-processing (wrap_detection) on recorded output tensors.
+
+Compares the original per-row Python loop decoder against the vectorized
+yolo_server.wrap_detection and checks that both return the same detections.
+Also times the NMS variants on the decoded candidates (the old class-agnostic
+NMSBoxes, the offset trick in batched_nms and cv2.dnn.NMSBoxesBatched) and
+counts boxes that class-agnostic NMS wrongly suppressed across classes.
+Exits with status 1 if the decoders disagree on any tensor or the two
+per-class NMS variants keep different boxes.
+
+Usage:
+    # Record raw network outputs for a session's frames (needs the model)
+    python3 bench_postprocess.py --record sessions/20260405_115449 --tensors tensors/
+    # Benchmark on the recorded tensors
+    python3 bench_postprocess.py --tensors tensors/
+    # Or on synthetic tensors when no recording is available
+    python3 bench_postprocess.py --synthetic 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import frame_pack
+import yolo_server
+from yolo_server import (
+    CONFIDENCE_THRESHOLD, INPUT_WIDTH, NMS_THRESHOLD,
+    SCORE_THRESHOLD, batched_nms, decode_predictions, wrap_detection,
+)
+
+
+def wrap_detection_loop(output_data, factors):
+    """Original row-by-row decoder with one NMS per class, kept as the reference."""
+    class_ids = []
+    confidences = []
+    boxes = []
+
+    rows = output_data.shape[0]
+    x_factor, y_factor = factors
+
+    for r in range(rows):
+        row = output_data[r]
+        confidence = row[4]
+        if confidence >= CONFIDENCE_THRESHOLD:
+            classes_scores = row[5:]
+            # Column vector so maxLoc[1] is the class index on every OpenCV version
+            _, _, _, max_indx = cv2.minMaxLoc(classes_scores.reshape(-1, 1))
+            class_id = max_indx[1]
+            if (classes_scores[class_id] > SCORE_THRESHOLD):
+                confidences.append(float(confidence))
+                class_ids.append(class_id)
+                x, y, w, h = row[0].item(), row[1].item(), row[2].item(), row[3].item()
+                left = int((x - 0.5 * w) * x_factor)
+                top = int((y - 0.5 * h) * y_factor)
+                width = int(w * x_factor)
+                height = int(h * y_factor)
+                boxes.append([left, top, width, height])
+
+    confidences = np.array(confidences).astype(np.float32)
+    indexes = []
+    for class_id in sorted(set(class_ids)):
+        members = [i for i, c in enumerate(class_ids) if c == class_id]
+        keep = cv2.dnn.NMSBoxes([boxes[i] for i in members], confidences[members],
+                                CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+        indexes.extend(members[k] for k in np.array(keep).reshape(-1))
+    indexes.sort(key=lambda i: -confidences[i])
+
+    result_class_ids, result_confidences, result_boxes = [], [], []
+    for i in indexes:
+        result_confidences.append(confidences[i])
+        result_class_ids.append(class_ids[i])
+        result_boxes.append(boxes[i])
+    return result_class_ids, result_confidences, result_boxes
+
+
+def synthetic_tensor(rng, rows=25200, n_objects=8):
+    """Random (rows, 85) tensor with a few high-objectness clusters."""
+    out = rng.random((rows, 85), dtype=np.float32)
+    out[:, 0:2] *= INPUT_WIDTH
+    out[:, 2:4] *= 120
+    out[:, 4] *= 0.3  # background rows stay below threshold
+    for _ in range(n_objects):
+        idx = rng.choice(rows, size=20, replace=False)
+        out[idx, 4] = rng.uniform(0.4, 0.95, size=20)
+        out[idx, 0:2] = rng.uniform(50, 590, size=2) + rng.normal(0, 3, (20, 2))
+        out[idx, 2:4] = rng.uniform(40, 200, size=2) + rng.normal(0, 3, (20, 2))
+        out[idx, 5 + rng.integers(80)] = rng.uniform(0.5, 1.0, size=20)
+    return out
+
+
+def record_tensors(session: Path, out_dir: Path, limit: int, engine_options: dict):
+    """Run the model over a session's rgb/ frames and save raw outputs."""
+    engine = yolo_server.build_engine(engine_options)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    frames = frame_pack.list_frames(session / "rgb", ".jpg")[:limit]
+    for ts, source in frames:
+        img = cv2.imdecode(np.frombuffer(frame_pack.read_bytes(source), np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        input_image, factors = yolo_server.format_yolov5(img)
+        outputs = yolo_server.detect(input_image, engine)
+        np.savez(str(out_dir / f"{ts}.npz"), output=outputs[0], factors=np.array(factors))
+    print(f"Recorded {len(frames)} tensors to {out_dir}")
+
+
+def load_tensors(tensor_dir: Path):
+    """Yield ((x_factor, y_factor), tensor) pairs from a --record directory."""
+    for path in sorted(tensor_dir.glob("*.npz")):
+        data = np.load(str(path))
+        tensor = data["output"]
+        yield tuple(float(f) for f in data["factors"]), tensor.reshape(-1, tensor.shape[-1])
+
+
+def agnostic_nms(class_ids, confidences, boxes):
+    """The previous single class-agnostic NMSBoxes call."""
+    return cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(),
+                            CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+
+
+def batched_nms_cv2(class_ids, confidences, boxes):
+    return cv2.dnn.NMSBoxesBatched(boxes.tolist(), confidences.tolist(), class_ids.tolist(),
+                                   CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+
+
+def detection_set(class_ids, confidences, boxes):
+    """Order-independent view of a decoder result (NMS ties may come out in any order)."""
+    return sorted((int(c), [int(v) for v in b], round(float(s), 5))
+                  for c, s, b in zip(class_ids, confidences, boxes))
+
+
+def time_decoder(fn, samples, repeats):
+    times = []
+    for _ in range(repeats):
+        for factors, tensor in samples:
+            t0 = time.perf_counter()
+            fn(tensor, factors)
+            times.append(time.perf_counter() - t0)
+    return np.array(times) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YOLO post-processing")
+    parser.add_argument("--tensors", type=str, default=None,
+                        help="Directory of recorded output tensors (.npz)")
+    parser.add_argument("--record", type=str, default=None,
+                        help="Session directory to record tensors from (writes to --tensors)")
+    parser.add_argument("--limit", type=int, default=100,
+                        help="Max frames to record (default: 100)")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Benchmark on N synthetic tensors instead")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--engine", choices=["opencv", "onnxruntime"], default="opencv",
+                        help="Inference backend for --record (default: opencv)")
+    parser.add_argument("--device", choices=["cuda", "cpu"], default="cuda",
+                        help="OpenCV DNN target for --record (default: cuda)")
+    parser.add_argument("--model", type=str, default=yolo_server.MODEL_PATH,
+                        help=f"ONNX model for --record (default: {yolo_server.MODEL_PATH})")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.tensors:
+            sys.exit("--record requires --tensors output directory")
+        engine_options = dict(yolo_server.engine_options, engine=args.engine, device=args.device,
+                              model=args.model)
+        record_tensors(Path(args.record), Path(args.tensors), args.limit, engine_options)
+        return
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # 848x480 frame letterboxed to 640x362
+        factors = (848 / 640, 480 / 362)
+        samples = [(factors, synthetic_tensor(rng)) for _ in range(args.synthetic)]
+    elif args.tensors:
+        samples = list(load_tensors(Path(args.tensors)))
+    else:
+        sys.exit("Specify --tensors DIR or --synthetic N")
+    if not samples:
+        sys.exit("No tensors found")
+
+    mismatches = 0
+    for factors, tensor in samples:
+        if detection_set(*wrap_detection_loop(tensor, factors)) != \
+                detection_set(*wrap_detection(tensor, factors)):
+            mismatches += 1
+
+    print(f"Tensors: {len(samples)}  repeats: {args.repeats}")
+    results = {}
+    for name, fn in (("loop", wrap_detection_loop), ("vectorized", wrap_detection)):
+        t = time_decoder(fn, samples, args.repeats)
+        results[name] = t
+        print(f"  {name:<11} mean {t.mean():7.3f} ms  p50 {np.percentile(t, 50):7.3f} ms  "
+              f"p95 {np.percentile(t, 95):7.3f} ms")
+    print(f"  speedup     {results['loop'].mean() / results['vectorized'].mean():.1f}x")
+    print(f"  mismatches  {mismatches}/{len(samples)}")
+
+    # NMS alone, on the decoded candidates
+    candidates = [decode_predictions(tensor, factors) for factors, tensor in samples]
+    candidates = [c for c in candidates if len(c[2])]
+    nms_variants = [("agnostic", agnostic_nms), ("offset", batched_nms)]
+    if hasattr(cv2.dnn, "NMSBoxesBatched"):
+        nms_variants.append(("batched", batched_nms_cv2))
+    print(f"NMS on {len(candidates)} candidate sets")
+    kept = {}
+    for name, fn in nms_variants:
+        times = []
+        for _ in range(args.repeats):
+            for cand in candidates:
+                t0 = time.perf_counter()
+                fn(*cand)
+                times.append(time.perf_counter() - t0)
+        t = np.array(times) * 1000.0
+        kept[name] = [set(np.array(fn(*cand)).reshape(-1).tolist()) for cand in candidates]
+        print(f"  {name:<11} mean {t.mean():7.3f} ms  p50 {np.percentile(t, 50):7.3f} ms  "
+              f"p95 {np.percentile(t, 95):7.3f} ms  kept {sum(len(k) for k in kept[name])}")
+    differ = 0
+    if "batched" in kept:
+        differ = sum(a != b for a, b in zip(kept["offset"], kept["batched"]))
+        print(f"  offset vs batched differ on {differ}/{len(candidates)} sets")
+    lost = sum(len(aware - agnostic) for aware, agnostic in zip(kept["offset"], kept["agnostic"]))
+    print(f"  boxes suppressed across classes by agnostic NMS: {lost}")
+
+    # Non-zero exit so a post-processing regression fails a scripted run
+    if mismatches or differ:
+        print(f"FAILED: {mismatches} decoder mismatches, {differ} NMS differences")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Benchmark quantized YOLOv5 variants against the FP32 model on session frames.
+
+Every variant runs over the same rgb/ frames. Reports FPS and latency
+percentiles (letterbox + blob + forward + post-processing, JPEG decode
+excluded), plus per-frame agreement with the FP32 baseline. A baseline box
+counts as matched when a variant box of the same label overlaps it with
+IoU >= --iou.
+
+Usage:
+    python3 bench_quantized.py sessions/20260405_115449 \\
+        --variant int8-dynamic=config_files/yolov5s-int8-dynamic.onnx \\
+        --variant int8-static=config_files/yolov5s-int8-static.onnx
+    # Only agreement on the chase targets (targets.yaml)
+    python3 bench_quantized.py sessions/20260405_115449 --targets --variant ...
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import frame_pack
+import yolo_server
+
+
+def iou(a, b):
+    """IoU of two [x, y, w, h] boxes."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_frame(baseline, candidate, iou_threshold):
+    """Greedy one-to-one matching of two detection lists.
+
+    Returns (matched, label_matched, ious): pairs over the IoU threshold,
+    how many of those agree on the label, and the IoU of each pair.
+    """
+    pairs = sorted(((iou(b[2], c[2]), i, j)
+                    for i, b in enumerate(baseline) for j, c in enumerate(candidate)),
+                   reverse=True)
+    used_b, used_c, ious, label_matched = set(), set(), [], 0
+    for overlap, i, j in pairs:
+        if overlap < iou_threshold:
+            break
+        if i in used_b or j in used_c:
+            continue
+        used_b.add(i)
+        used_c.add(j)
+        ious.append(overlap)
+        label_matched += baseline[i][0] == candidate[j][0]
+    return len(ious), label_matched, ious
+
+
+def run_variant(engine, frames, allowed_classes, warmup):
+    """Detections per frame [(class_id, confidence, box), ...] and per-frame latency (ms)."""
+    for img in frames[:warmup]:
+        canvas, _ = yolo_server.format_yolov5(img)
+        engine.infer(yolo_server.make_blob([canvas]))
+    detections, latencies = [], []
+    for img in frames:
+        t0 = time.perf_counter()
+        canvas, factors = yolo_server.format_yolov5(img)
+        outputs = engine.infer(yolo_server.make_blob([canvas]))
+        class_ids, confidences, boxes = yolo_server.wrap_detection(outputs[0], factors, allowed_classes)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        detections.append(list(zip(class_ids, confidences, boxes)))
+    return detections, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized YOLO variants vs FP32")
+    parser.add_argument("session", type=str, help="Session directory with rgb/ frames")
+    parser.add_argument("--variant", action="append", default=[], metavar="NAME=PATH",
+                        help="Model variant to compare (repeatable)")
+    parser.add_argument("--baseline", type=str, default=yolo_server.MODEL_PATH,
+                        help=f"FP32 reference model (default: {yolo_server.MODEL_PATH})")
+    parser.add_argument("--engine", choices=["opencv", "onnxruntime"], default="onnxruntime",
+                        help="Inference backend (default: onnxruntime)")
+    parser.add_argument("--device", choices=["cuda", "cpu"], default="cpu",
+                        help="OpenCV DNN target (default: cpu)")
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=300, help="Max frames (default: 300)")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--iou", type=float, default=0.5,
+                        help="IoU threshold for a matched box (default: 0.5)")
+    parser.add_argument("--targets", action="store_true",
+                        help="Only keep targets.yaml classes when comparing")
+    args = parser.parse_args()
+
+    if not args.variant:
+        sys.exit("Specify at least one --variant NAME=PATH")
+    sources = frame_pack.list_frames(Path(args.session) / "rgb", ".jpg")[:args.limit]
+    frames = [img for img in (cv2.imdecode(np.frombuffer(frame_pack.read_bytes(source), np.uint8),
+                                           cv2.IMREAD_COLOR) for _, source in sources)
+              if img is not None]
+    if not frames:
+        sys.exit(f"No frames in {args.session}/rgb")
+
+    yolo_server.class_list = yolo_server.load_classes()
+    allowed = None
+    if args.targets:
+        allowed = yolo_server.class_filter_from_labels(yolo_server.load_target_labels())
+
+    variants = [("fp32", args.baseline)] + [tuple(v.split("=", 1)) for v in args.variant]
+    print(f"Frames: {len(frames)}  engine: {args.engine}  IoU >= {args.iou}"
+          f"{'  (targets only)' if args.targets else ''}")
+    print(f"{'variant':<14} {'FPS':>6} {'p50':>8} {'p95':>8} {'p99':>8}  "
+          f"{'recall':>6} {'prec':>6} {'label':>6} {'IoU':>5} {'frames=':>7}")
+
+    baseline = None
+    for name, model_path in variants:
+        options = dict(yolo_server.engine_options, engine=args.engine, device=args.device,
+                       model=model_path, intra_op_threads=args.intra_op_threads)
+        detections, t = run_variant(yolo_server.build_engine(options), frames, allowed, args.warmup)
+        p50, p95, p99 = np.percentile(t, [50, 95, 99])
+        line = (f"{name:<14} {1000.0 / t.mean():6.1f} {p50:6.1f}ms {p95:6.1f}ms {p99:6.1f}ms")
+        if baseline is None:
+            baseline = detections
+            print(line)
+            continue
+
+        n_base = sum(len(d) for d in baseline)
+        n_cand = sum(len(d) for d in detections)
+        matched = label_matched = identical = 0
+        ious = []
+        for base_dets, cand_dets in zip(baseline, detections):
+            m, lm, frame_ious = match_frame(base_dets, cand_dets, args.iou)
+            matched += m
+            label_matched += lm
+            ious.extend(frame_ious)
+            # Same boxes, same labels, nothing extra
+            identical += lm == len(base_dets) == len(cand_dets)
+        print(f"{line}  {matched / max(n_base, 1):6.3f} {matched / max(n_cand, 1):6.3f} "
+              f"{label_matched / max(matched, 1):6.3f} {np.mean(ious) if ious else 0.0:5.3f} "
+              f"{identical / len(frames):7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Replay a recorded session against a running yolo_server and measure throughput.
+
+Frames from sessions/<ts>/rgb/*.jpg are posted to /detect/ (or /detect/raw,
+/detect/batch) by N concurrent clients for a fixed duration. --mode shm
+publishes them into a frame ring at camera rate, like camera_server, and
+posts {"ring", "seq"} of the newest frame to /detect/shm, like
+detection_server; it must run on the yolo_server host. Reports sustained
+FPS, a client-side latency histogram and the per-stage breakdown from the
+server's Server-Timing headers, and writes everything to a JSON file that can
+be diffed between runs.
+
+Works against the CPU backends on a GPU-less box:
+    python3 yolo_server.py cpu                                # or --engine onnxruntime
+    python3 bench_server.py sessions/20260405_115449 --concurrency 1,2,4
+    python3 bench_server.py sessions/20260405_115449 --mode batch --batch-size 4
+    python3 bench_server.py sessions/20260405_115449 --mode raw --output raw.json
+
+Control-loop latency under bulk load (two shells):
+    python3 bench_server.py sessions/20260405_115449 --mode raw --concurrency 4
+    python3 bench_server.py sessions/20260405_115449 --mode shm --priority realtime
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+import cv2
+import numpy as np
+
+import frame_pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+import frame_ring
+
+# Client latency histogram bucket edges (ms); the last bucket is open-ended
+HISTOGRAM_EDGES_MS = [0, 10, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000]
+
+# Unique per run so X-Frame-Id never hits the server's result cache from an earlier run
+RUN_ID = f"{time.time():.0f}"
+
+
+def load_frames(session: Path, limit: int, raw: bool):
+    """JPEG bytes (or decoded BGR frames for --mode raw) of a session's rgb/ frames."""
+    frames = []
+    for _, source in frame_pack.list_frames(session / "rgb", ".jpg")[:limit]:
+        data = frame_pack.read_bytes(source)
+        if raw:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            frames.append(img)
+        else:
+            frames.append(data)
+    return frames
+
+
+class RingPublisher:
+    """camera_server stand-in: cycles frames through a frame ring at a fixed rate."""
+
+    def __init__(self, frames, fps):
+        # One ring holds one frame shape; the session's odd-sized frames are left out
+        self.frames = [f for f in frames if f.shape == frames[0].shape]
+        self.fps = fps
+        self.name = f"bench_{RUN_ID}"
+        self.writer = frame_ring.FrameRingWriter(self.name, self.frames[0].shape, (1, 1))
+        self.seq = self.writer.publish(self.frames[0], np.zeros((1, 1), np.uint16))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        depth = np.zeros((1, 1), np.uint16)
+        for n in itertools.count(1):
+            if self._stop.wait(1.0 / self.fps):
+                break
+            self.seq = self.writer.publish(self.frames[n % len(self.frames)], depth)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.writer.close()
+
+
+def parse_server_timing(header):
+    """'queue;dur=0.1, forward;dur=30.2' -> {'queue': 0.1, 'forward': 30.2}"""
+    stages = {}
+    for entry in header.split(","):
+        name, _, dur = entry.strip().partition(";dur=")
+        if dur:
+            stages[name] = float(dur)
+    return stages
+
+
+def build_request(mode, frames, batch_size, counter, priority, client_id):
+    """(path, aiohttp kwargs, images in request) for the next request.
+
+    For --mode shm, frames is the RingPublisher.
+    """
+    n = next(counter)
+    headers = {"X-Frame-Id": f"bench-{RUN_ID}-{n}",  # unique: never served from the result cache
+               "X-Priority": priority,
+               # One identity per client: realtime frames from the same client supersede each other
+               "X-Client-Id": client_id}
+    if mode == "batch":
+        form = aiohttp.FormData()
+        for i in range(batch_size):
+            form.add_field("files", frames[(n * batch_size + i) % len(frames)],
+                           filename=f"{n}_{i}.jpg", content_type="image/jpeg")
+        return "/detect/batch", {"data": form, "headers": headers}, batch_size
+    if mode == "shm":
+        # The newest frame, as detection_server sends it
+        return "/detect/shm", {"json": {"ring": frames.name, "seq": frames.seq},
+                               "headers": headers}, 1
+    frame = frames[n % len(frames)]
+    if mode == "raw":
+        headers.update({"X-Width": str(frame.shape[1]), "X-Height": str(frame.shape[0])})
+        return "/detect/raw", {"data": frame.tobytes(), "headers": headers}, 1
+    form = aiohttp.FormData()
+    form.add_field("file", frame, filename=f"{n}.jpg", content_type="image/jpeg")
+    return "/detect/", {"data": form, "headers": headers}, 1
+
+
+async def client(session, url, mode, frames, batch_size, counter, priority, client_id, deadline,
+                 samples):
+    while time.perf_counter() < deadline:
+        path, kwargs, images = build_request(mode, frames, batch_size, counter, priority, client_id)
+        t0 = time.perf_counter()
+        try:
+            async with session.post(url + path, **kwargs) as resp:
+                await resp.read()
+                status = resp.status
+                timing = resp.headers.get("Server-Timing", "")
+        except aiohttp.ClientError:
+            status, timing = 0, ""
+        samples.append({
+            "end": time.perf_counter(),
+            "latency_ms": (time.perf_counter() - t0) * 1000.0,
+            "status": status,
+            "images": images,
+            "stages": parse_server_timing(timing) if status == 200 else {},
+        })
+
+
+async def run_level(url, mode, frames, batch_size, concurrency, duration, warmup, counter,
+                    priority):
+    """Drive the server with `concurrency` clients; samples from the warmup period are dropped."""
+    samples = []
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        start = time.perf_counter()
+        deadline = start + warmup + duration
+        await asyncio.gather(*(client(session, url, mode, frames, batch_size, counter, priority,
+                                      f"bench-{RUN_ID}-client{i}", deadline, samples)
+                               for i in range(concurrency)))
+    measured = [s for s in samples if s["end"] >= start + warmup]
+    return summarize(measured, concurrency, duration)
+
+
+def percentiles(values):
+    values = np.array(values)
+    if not len(values):
+        return {}
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {"mean": round(float(values.mean()), 3), "p50": round(float(p50), 3),
+            "p90": round(float(p90), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "max": round(float(values.max()), 3)}
+
+
+def summarize(samples, concurrency, duration):
+    ok = [s for s in samples if s["status"] == 200]
+    latencies = [s["latency_ms"] for s in ok]
+    counts, _ = np.histogram(latencies, bins=HISTOGRAM_EDGES_MS + [float("inf")])
+    stage_names = sorted({name for s in ok for name in s["stages"]})
+    return {
+        "concurrency": concurrency,
+        "requests": len(ok),
+        "errors": {str(status): sum(1 for s in samples if s["status"] == status)
+                   for status in sorted({s["status"] for s in samples} - {200})},
+        "fps": round(sum(s["images"] for s in ok) / duration, 2),
+        "requests_per_s": round(len(ok) / duration, 2),
+        "latency_ms": percentiles(latencies),
+        "histogram_ms": {"edges": HISTOGRAM_EDGES_MS, "counts": counts.tolist()},
+        "stages_ms": {name: percentiles([s["stages"][name] for s in ok if name in s["stages"]])
+                      for name in stage_names},
+    }
+
+
+def print_level(result):
+    lat = result["latency_ms"]
+    print(f"\nconcurrency {result['concurrency']}: {result['fps']:.1f} FPS "
+          f"({result['requests']} requests, errors {result['errors'] or 0})")
+    if not lat:
+        return
+    print(f"  latency  mean {lat['mean']:.1f}  p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  "
+          f"p99 {lat['p99']:.1f}  max {lat['max']:.1f} ms")
+    counts = result["histogram_ms"]["counts"]
+    peak = max(counts) or 1
+    edges = HISTOGRAM_EDGES_MS + [None]
+    for lo, hi, count in zip(edges, edges[1:], counts):
+        if count:
+            label = f"{lo}-{hi}" if hi is not None else f">{lo}"
+            print(f"  {label:>10} ms {'#' * max(1, int(40 * count / peak)):<40} {count}")
+    print(f"  {'stage':<16}    mean      p50      p95 (ms)")
+    for name, stats in result["stages_ms"].items():
+        print(f"  {name:<16} {stats['mean']:7.2f}  {stats['p50']:7.2f}  {stats['p95']:7.2f}")
+
+
+async def fetch_metrics(url):
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/metrics") as resp:
+                return await resp.json() if resp.status == 200 else None
+    except aiohttp.ClientError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session against yolo_server")
+    parser.add_argument("session", type=str, help="Session directory with rgb/ frames")
+    parser.add_argument("--url", type=str, default="http://localhost:8765")
+    parser.add_argument("--mode", choices=["single", "raw", "batch", "shm"], default="single",
+                        help="/detect/ JPEG, /detect/raw BGR, /detect/batch or /detect/shm "
+                             "frame ring (default: single)")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--concurrency", type=str, default="1",
+                        help="Comma-separated client counts, one run each (default: 1)")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="Measured seconds per concurrency level (default: 30)")
+    parser.add_argument("--warmup", type=float, default=3.0,
+                        help="Unmeasured seconds before each level (default: 3)")
+    parser.add_argument("--ring-fps", type=float, default=60.0,
+                        help="Frames published per second in --mode shm (default: 60)")
+    parser.add_argument("--limit", type=int, default=500, help="Max frames loaded (default: 500)")
+    parser.add_argument("--priority", choices=["bulk", "realtime"], default="bulk",
+                        help="X-Priority sent with each request; run a realtime bench next to a "
+                             "bulk one to check control-loop latency under load (default: bulk)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON result file (default: bench_<session>_<mode>_<time>.json)")
+    args = parser.parse_args()
+
+    session = Path(args.session)
+    frames = load_frames(session, args.limit, raw=args.mode in ("raw", "shm"))
+    if not frames:
+        sys.exit(f"No frames in {session}/rgb")
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+    print(f"{len(frames)} frames from {session}, mode {args.mode}, "
+          f"{args.duration:.0f}s per level against {args.url}")
+
+    ring = RingPublisher(frames, args.ring_fps) if args.mode == "shm" else None
+    results = []
+    counter = itertools.count()
+    try:
+        for concurrency in levels:
+            result = asyncio.run(run_level(args.url, args.mode, ring or frames, args.batch_size,
+                                           concurrency, args.duration, args.warmup, counter,
+                                           args.priority))
+            print_level(result)
+            results.append(result)
+    finally:
+        if ring is not None:
+            ring.close()
+
+    report = {
+        "session": str(session),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "config": {"url": args.url, "mode": args.mode, "frames": len(frames),
+                   "batch_size": args.batch_size if args.mode == "batch" else 1,
+                   "priority": args.priority,
+                   "ring_fps": args.ring_fps if args.mode == "shm" else None,
+                   "duration_s": args.duration, "warmup_s": args.warmup},
+        "levels": results,
+        "server_metrics": asyncio.run(fetch_metrics(args.url)),
+    }
+    output = Path(args.output or f"bench_{session.name}_{args.mode}_"
+                                 f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.write_text(json.dumps(report, indent=2, sort_keys=True))
+    print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
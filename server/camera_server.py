@@ -5,7 +5,10 @@ frame and depth-based distance queries to clients via FastAPI.
 """
 
 import argparse
+import collections
 import json
+import os
+import sys
 import threading
 import time
 import queue
@@ -23,10 +26,17 @@ from fastapi.responses import Response
 from pydantic import BaseModel, Field
 import uvicorn
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+import frame_ring
+import frame_pack
+import depth_codec
+import depth_stats
+
 
 # Estimates for initial frame limit (recalculated after RECALC_AFTER_FRAMES)
 ESTIMATED_RGB_SIZE = 150_000       # ~150KB per JPEG at quality 85, 848×480
 ESTIMATED_DEPTH_SIZE = 820_000     # ~820KB per .npy (848×480 uint16)
+ESTIMATED_DEPTH_RATIO = 2.0        # Lossless depth codecs vs .npy (bench_depth_codec.py)
 DISK_HEADROOM = 100_000_000        # Reserve 100MB free
 RECALC_AFTER_FRAMES = 30           # Recalculate frame limit from actual sizes
 
@@ -38,6 +48,65 @@ CLIFF_BOTTOM_FRAC = 0.30       # Bottom 30% of rows to sample
 CLIFF_DEPTH_THRESHOLD = 0.8    # Metres; floor closer than this is normal ground
 CLIFF_VALID_FRAC_MIN = 0.10    # Fraction of region pixels that must be valid
 
+# Capture pipeline: frames waiting between stages (latest wins) and the
+# window stage rates/occupancy are averaged over in /status
+CAPTURE_QUEUE_SIZE = 1
+STAGE_STATS_WINDOW = 2.0       # Seconds
+
+
+class LatestQueue:
+    """Bounded hand-off between capture stages; a full queue drops its oldest item."""
+
+    def __init__(self, maxsize: int = 1):
+        self.maxsize = maxsize
+        self.drops: int = 0
+        self._items: collections.deque = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item) -> None:
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.drops += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: float):
+        """Oldest item, or None after timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+
+class StageStats:
+    """Frames and busy time of one capture stage over STAGE_STATS_WINDOW seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._frames = 0
+        self._busy = 0.0
+        self._last = {"fps": 0.0, "occupancy": 0.0, "busy_ms": 0.0}
+
+    def record(self, busy_s: float) -> None:
+        with self._lock:
+            self._frames += 1
+            self._busy += busy_s
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed >= STAGE_STATS_WINDOW:
+                self._last = {
+                    "fps": round(self._frames / elapsed, 1),
+                    "occupancy": round(self._busy / elapsed, 3),
+                    "busy_ms": round(self._busy / self._frames * 1000.0, 2),
+                }
+                self._window_start, self._frames, self._busy = now, 0, 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._last)
+
 
 class DistanceRequest(BaseModel):
     bbox: List[float] = Field(..., min_length=4, max_length=4, description="[x, y, w, h]")
@@ -46,8 +115,12 @@ class DistanceRequest(BaseModel):
 
 class CameraManager:
     def __init__(self, session_dir: str = "sessions", jpeg_quality: int = 85,
-                 frame_limit: Optional[int] = None, save_depth: bool = True):
+                 frame_limit: Optional[int] = None, save_depth: bool = True,
+                 frame_ring_name: Optional[str] = frame_ring.DEFAULT_NAME,
+                 frame_ring_slots: int = frame_ring.DEFAULT_SLOTS,
+                 pack_frames: bool = True, depth_codec_spec: str = "npy"):
         self.jpeg_quality = jpeg_quality
+        self.depth_codec = depth_codec.DepthCodec(depth_codec_spec)
         self.depth_saving_enabled: bool = save_depth
         self.session_base = Path(session_dir).resolve()
 
@@ -62,6 +135,21 @@ class CameraManager:
         for d in (self.rgb_dir, self.depth_dir, self.yolo_dir, self.servo_dir):
             d.mkdir(parents=True, exist_ok=True)
 
+        # Saved frames go to append-only packs (frame_pack.py) rather than
+        # one file per frame, unless pack_frames is off
+        self.pack_frames = pack_frames
+        self._rgb_pack: Optional[frame_pack.FramePackWriter] = None
+        self._depth_pack: Optional[frame_pack.FramePackWriter] = None
+        if pack_frames:
+            self._rgb_pack = frame_pack.FramePackWriter(self.rgb_dir)
+            self._depth_pack = frame_pack.FramePackWriter(self.depth_dir)
+        # Bytes written so far, for the frame limit (no directory scans)
+        self._rgb_bytes: int = 0
+        self._depth_bytes: int = 0
+        self._depth_frames: int = 0
+        self._depth_raw_bytes: int = 0
+        self._depth_encode_s: float = 0.0
+
         # Frame limit
         if frame_limit is not None:
             self.frame_limit = frame_limit
@@ -73,7 +161,11 @@ class CameraManager:
         self._lock = threading.Lock()
         self.latest_color_image: Optional[np.ndarray] = None
         self.latest_depth_image: Optional[np.ndarray] = None
-        self.latest_jpeg: Optional[bytes] = None
+        # JPEG of the latest frame, encoded on demand (/frame, writer) and
+        # cached by frame sequence number: (seq, bytes)
+        self._jpeg_cache: tuple = (0, None)
+        self._jpeg_lock = threading.Lock()
+        self.jpeg_encodes: int = 0
         self.latest_timestamp: str = ""
         self.depth_scale: float = 0.0
         self.frame_count: int = 0
@@ -81,8 +173,17 @@ class CameraManager:
         self.capture_fps: float = 0.0
         self.cliff_detected: bool = False
 
-        # Write queue — large enough to buffer ~2s of capture at 60fps
-        self._write_queue: queue.Queue = queue.Queue(maxsize=120)
+        # Shared-memory ring of color + depth frames for local readers
+        # (detection_server, yolo_server). Created on the first frame, once
+        # the filtered depth shape is known.
+        self.frame_ring_name = frame_ring_name
+        self.frame_ring_slots = frame_ring_slots
+        self._frame_ring: Optional[frame_ring.FrameRingWriter] = None
+        self.frame_seq: int = 0
+
+        # Write queue — ~1s of capture at 60fps. Holds raw frames (~1.2MB
+        # color each), JPEG-encoded by the writer thread.
+        self._write_queue: queue.Queue = queue.Queue(maxsize=60)
 
         # RealSense setup
         self.pipeline = rs.pipeline()
@@ -104,11 +205,25 @@ class CameraManager:
         for _ in range(30):
             self.pipeline.wait_for_frames()
 
+        # Capture pipeline: acquire -> align/filter -> cliff/publish, one
+        # thread per stage (librealsense releases the GIL), joined by
+        # latest-wins queues so a slow stage drops frames instead of
+        # stalling the camera
+        self._process_queue = LatestQueue(CAPTURE_QUEUE_SIZE)
+        self._publish_queue = LatestQueue(CAPTURE_QUEUE_SIZE)
+        self.stage_stats = {name: StageStats() for name in ("acquire", "process", "publish")}
+        self.save_drops: int = 0
+
         # Threads
         self._stop_event = threading.Event()
-        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._stage_threads = [
+            threading.Thread(target=loop, name=f"capture-{name}", daemon=True)
+            for name, loop in (("acquire", self._acquire_loop),
+                               ("process", self._process_loop),
+                               ("publish", self._publish_loop))]
         self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
-        self._capture_thread.start()
+        for thread in self._stage_threads:
+            thread.start()
         self._writer_thread.start()
 
         # Write session metadata (start time)
@@ -116,6 +231,8 @@ class CameraManager:
         self._session_meta = {
             "session_start": self.session_start.isoformat(),
             "session_end": None,
+            "frame_layout": "pack" if pack_frames else "loose",
+            "depth_codec": depth_codec_spec,
         }
         self._session_meta_path.write_text(json.dumps(self._session_meta, indent=2))
         print(f"Camera server started. Session: {self.session_path}")
@@ -124,7 +241,11 @@ class CameraManager:
         self.session_base.mkdir(parents=True, exist_ok=True)
         available = shutil.disk_usage(self.session_base).free
         budget = available - DISK_HEADROOM
-        depth_size = ESTIMATED_DEPTH_SIZE if self.depth_saving_enabled else 0
+        depth_size = 0
+        if self.depth_saving_enabled:
+            depth_size = ESTIMATED_DEPTH_SIZE
+            if self.depth_codec.kind != "npy":
+                depth_size /= ESTIMATED_DEPTH_RATIO
         est_frame_size = ESTIMATED_RGB_SIZE + depth_size
         return max(100, int(budget / est_frame_size))
 
@@ -132,17 +253,30 @@ class CameraManager:
         now = datetime.now()
         return now.strftime("%Y%m%d_%H%M%S") + f"_{now.microsecond:06d}"
 
-    def _capture_loop(self):
-        print("Capture thread started")
-        fps_counter = 0
-        fps_timer = time.monotonic()
-
+    def _acquire_loop(self):
+        """Stage 1: pull framesets from the camera as fast as it delivers them."""
+        print("Acquire thread started")
+        stats = self.stage_stats["acquire"]
         while not self._stop_event.is_set():
             try:
                 frames = self.pipeline.wait_for_frames(timeout_ms=1000)
             except RuntimeError:
                 continue
-
+            t0 = time.perf_counter()
+            self._process_queue.put((frames, self._make_timestamp()))
+            stats.record(time.perf_counter() - t0)
+        print("Acquire thread stopped")
+
+    def _process_loop(self):
+        """Stage 2: align depth to color and run the depth filters."""
+        print("Process thread started")
+        stats = self.stage_stats["process"]
+        while not self._stop_event.is_set():
+            item = self._process_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            t0 = time.perf_counter()
+            frames, timestamp = item
             try:
                 aligned = self.align.process(frames)
             except RuntimeError as e:
@@ -165,33 +299,48 @@ class CameraManager:
 
             color_image = np.asanyarray(color_frame.get_data())
             depth_image = np.asanyarray(filtered_depth.get_data())
+            self._publish_queue.put((color_image, depth_image, timestamp))
+            stats.record(time.perf_counter() - t0)
+        print("Process thread stopped")
+
+    def _publish_loop(self):
+        """Stage 3: cliff check, shared-memory ring, latest-frame state, save queue."""
+        print("Publish thread started")
+        stats = self.stage_stats["publish"]
+        fps_counter = 0
+        fps_timer = time.monotonic()
 
-            # JPEG encode
-            encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
-            ok, jpeg_buf = cv2.imencode('.jpg', color_image, encode_params)
-            if not ok:
+        while not self._stop_event.is_set():
+            item = self._publish_queue.get(timeout=0.5)
+            if item is None:
                 continue
-            jpeg_bytes = jpeg_buf.tobytes()
+            t0 = time.perf_counter()
+            color_image, depth_image, timestamp = item
 
-            timestamp = self._make_timestamp()
+            # No JPEG encode here: frames are encoded only when /frame or
+            # the writer asks for them (jpeg_for)
             cliff = self._detect_cliff(depth_image)
+            seq = self.frame_seq + 1
+            self._publish_frame(color_image, depth_image, timestamp)
 
             with self._lock:
                 self.latest_color_image = color_image
                 self.latest_depth_image = depth_image
-                self.latest_jpeg = jpeg_bytes
                 self.latest_timestamp = timestamp
                 self.cliff_detected = cliff
+                self.frame_seq = seq
                 saving = self.saving_active
-                count = self.frame_count
 
             # Enqueue for saving
             if saving:
-                depth_to_save = depth_image if self.depth_saving_enabled else None
+                # Copy both: color and depth are views on librealsense frames,
+                # and queued frames must not pin its frame pool
+                depth_to_save = depth_image.copy() if self.depth_saving_enabled else None
                 try:
-                    self._write_queue.put_nowait((timestamp, jpeg_bytes, depth_to_save))
+                    self._write_queue.put_nowait((seq, timestamp, color_image.copy(), depth_to_save))
                 except queue.Full:
-                    pass  # Drop frame from saving, never block capture
+                    self.save_drops += 1  # Drop frame from saving, never block capture
+            stats.record(time.perf_counter() - t0)
 
             # FPS tracking
             fps_counter += 1
@@ -203,22 +352,72 @@ class CameraManager:
                 fps_counter = 0
                 fps_timer = now
 
-        print("Capture thread stopped")
+        print("Publish thread stopped")
+
+    def depth_codec_status(self) -> dict:
+        """Depth codec in use, its compression ratio and mean encode cost so far."""
+        frames = self._depth_frames
+        return {
+            "codec": self.depth_codec.spec,
+            "frames": frames,
+            "ratio": round(self._depth_raw_bytes / self._depth_bytes, 2) if frames else None,
+            "avg_kb": round(self._depth_bytes / frames / 1000, 1) if frames else None,
+            "encode_ms": round(self._depth_encode_s / frames * 1000, 2) if frames else None,
+        }
+
+    def pipeline_status(self) -> dict:
+        """Per-stage rate, occupancy (busy fraction of wall time) and dropped frames."""
+        stages = {name: stats.snapshot() for name, stats in self.stage_stats.items()}
+        # Frames dropped on the way into a stage (it was still busy with the previous one)
+        stages["process"]["dropped"] = self._process_queue.drops
+        stages["publish"]["dropped"] = self._publish_queue.drops
+        stages["save_dropped"] = self.save_drops
+        return stages
+
+    def jpeg_for(self, seq: int, color_image: np.ndarray) -> Optional[bytes]:
+        """JPEG of frame seq, encoded at most once (the latest one is cached)."""
+        with self._jpeg_lock:
+            cached_seq, jpeg = self._jpeg_cache
+            if cached_seq == seq:
+                return jpeg
+            encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+            ok, jpeg_buf = cv2.imencode('.jpg', color_image, encode_params)
+            if not ok:
+                return None
+            jpeg = jpeg_buf.tobytes()
+            self.jpeg_encodes += 1
+            # Never replace a newer frame's JPEG with a backlogged writer frame
+            if seq > cached_seq:
+                self._jpeg_cache = (seq, jpeg)
+            return jpeg
+
+    def _publish_frame(self, color_image: np.ndarray, depth_image: np.ndarray,
+                       timestamp: str) -> None:
+        """Copy the frame into the shared-memory ring (its sequence numbers follow frame_seq)."""
+        if not self.frame_ring_name:
+            return
+        if self._frame_ring is None:
+            try:
+                self._frame_ring = frame_ring.FrameRingWriter(
+                    self.frame_ring_name, color_image.shape, depth_image.shape,
+                    self.frame_ring_slots, self.depth_scale)
+            except OSError as e:
+                print(f"Frame ring disabled: {e}")
+                self.frame_ring_name = None
+                return
+            print(f"Frame ring /dev/shm/{self.frame_ring_name}: {self.frame_ring_slots} slots, "
+                  f"color {color_image.shape}, depth {depth_image.shape}")
+        self._frame_ring.publish(color_image, depth_image, timestamp)
 
     def _recalc_frame_limit(self):
-        """Recalculate frame limit from actual file sizes on disk."""
-        rgb_files = list(self.rgb_dir.glob("*.jpg"))
-        if not rgb_files:
+        """Recalculate frame limit from the actual sizes of the frames written."""
+        if not self.frame_count:
             return
-        total_rgb = sum(f.stat().st_size for f in rgb_files)
-        avg_rgb = total_rgb / len(rgb_files)
+        avg_rgb = self._rgb_bytes / self.frame_count
 
         avg_depth = 0
-        if self.depth_saving_enabled:
-            depth_files = list(self.depth_dir.glob("*.npy"))
-            if depth_files:
-                total_depth = sum(f.stat().st_size for f in depth_files)
-                avg_depth = total_depth / len(depth_files)
+        if self.depth_saving_enabled and self._depth_frames:
+            avg_depth = self._depth_bytes / self._depth_frames
 
         avg_frame = avg_rgb + avg_depth
         available = shutil.disk_usage(self.session_base).free
@@ -238,19 +437,39 @@ class CameraManager:
             except queue.Empty:
                 continue
 
-            timestamp, jpeg_bytes, depth_array = item
+            seq, timestamp, color_image, depth_array = item
 
-            # Write RGB JPEG
-            rgb_path = self.rgb_dir / f"{timestamp}.jpg"
-            rgb_path.write_bytes(jpeg_bytes)
-
-            # Write depth .npy if provided
+            # Write RGB JPEG (reuses the /frame encode of the same frame)
+            jpeg_bytes = self.jpeg_for(seq, color_image)
+            if jpeg_bytes is None:
+                continue
+            if self._rgb_pack is not None:
+                self._rgb_pack.append(timestamp, jpeg_bytes)
+            else:
+                rgb_path = self.rgb_dir / f"{timestamp}.jpg"
+                rgb_path.write_bytes(jpeg_bytes)
+
+            # Write depth (through the depth codec) if provided
+            depth_size = 0
             if depth_array is not None:
-                depth_path = self.depth_dir / f"{timestamp}.npy"
-                np.save(str(depth_path), depth_array)
+                t0 = time.perf_counter()
+                depth_bytes = self.depth_codec.encode(depth_array)
+                encode_s = time.perf_counter() - t0
+                depth_size = len(depth_bytes)
+                if self._depth_pack is not None:
+                    self._depth_pack.append(timestamp, depth_bytes)
+                else:
+                    depth_path = self.depth_dir / f"{timestamp}{self.depth_codec.suffix}"
+                    depth_path.write_bytes(depth_bytes)
 
             with self._lock:
                 self.frame_count += 1
+                self._rgb_bytes += len(jpeg_bytes)
+                if depth_size:
+                    self._depth_bytes += depth_size
+                    self._depth_frames += 1
+                    self._depth_raw_bytes += depth_array.nbytes
+                    self._depth_encode_s += encode_s
 
                 # Recalculate frame limit from actual sizes after first N frames
                 if not recalc_done and self.frame_count >= RECALC_AFTER_FRAMES:
@@ -272,11 +491,10 @@ class CameraManager:
         """
         h = depth_image.shape[0]
         y_start = int(h * (1.0 - CLIFF_BOTTOM_FRAC))
-        region = depth_image[y_start:, :]
-        valid = region[region > 0]
-        if len(valid) < region.size * CLIFF_VALID_FRAC_MIN:
+        hist = depth_stats.DepthHistogram(depth_image[y_start:, :])
+        if hist.valid_fraction() < CLIFF_VALID_FRAC_MIN:
             return True  # too few valid readings → surface out of range
-        median_m = float(np.median(valid)) * self.depth_scale
+        median_m = hist.median() * self.depth_scale
         return median_m > CLIFF_DEPTH_THRESHOLD
 
     def get_distance(self, bbox: List[float], shrink: float = 0.2) -> Optional[float]:
@@ -327,26 +545,30 @@ class CameraManager:
                 return float(val) * scale
             return None
 
-        region = depth_image[y1:y2, x1:x2]
-        valid = region[region > 0]
-        if len(valid) == 0:
+        median = depth_stats.valid_median(depth_image[y1:y2, x1:x2])
+        if median is None:
             # Expand to full bbox
-            region_full = depth_image[max(0, y):min(depth_h, y+h),
-                                      max(0, x):min(depth_w, x+w)]
-            valid = region_full[region_full > 0]
-            if len(valid) == 0:
+            median = depth_stats.valid_median(depth_image[max(0, y):min(depth_h, y+h),
+                                                          max(0, x):min(depth_w, x+w)])
+            if median is None:
                 print(f"get_distance: all zeros in region [{x1}:{x2},{y1}:{y2}]")
                 return None
             print(f"get_distance: shrunk region all zeros, used full bbox")
 
-        return float(np.median(valid)) * scale
+        return median * scale
 
     def shutdown(self):
         print("Shutting down camera manager...")
         self._stop_event.set()
-        self._capture_thread.join(timeout=3)
+        for thread in self._stage_threads:
+            thread.join(timeout=3)
         self._writer_thread.join(timeout=3)
         self.pipeline.stop()
+        for pack in (self._rgb_pack, self._depth_pack):
+            if pack is not None:
+                pack.close()
+        if self._frame_ring is not None:
+            self._frame_ring.close()
 
         # Write session end time
         self._session_meta["session_end"] = datetime.now().isoformat()
@@ -367,6 +589,10 @@ async def lifespan(app):
         jpeg_quality=cli_args.jpeg_quality,
         frame_limit=cli_args.frame_limit,
         save_depth=not cli_args.no_save_depth,
+        frame_ring_name=None if cli_args.no_frame_ring else cli_args.frame_ring,
+        frame_ring_slots=cli_args.frame_ring_slots,
+        pack_frames=not cli_args.loose_frames,
+        depth_codec_spec=cli_args.depth_codec,
     )
     yield
     if camera_manager:
@@ -377,17 +603,20 @@ app = FastAPI(title="Camera Server", version="1.0.0", lifespan=lifespan)
 
 
 @app.get("/frame")
-async def get_frame():
+def get_frame():
+    # Plain def: the on-demand JPEG encode runs in the threadpool, not the event loop
     if not camera_manager:
         raise HTTPException(status_code=500, detail="Camera not initialized")
 
     with camera_manager._lock:
-        jpeg = camera_manager.latest_jpeg
+        color = camera_manager.latest_color_image
+        seq = camera_manager.frame_seq
         timestamp = camera_manager.latest_timestamp
         frame_count = camera_manager.frame_count
         session_path = str(camera_manager.session_path)
         saving = camera_manager.saving_active
 
+    jpeg = camera_manager.jpeg_for(seq, color) if color is not None else None
     if jpeg is None:
         raise HTTPException(status_code=503, detail="No frame captured yet")
 
@@ -397,12 +626,42 @@ async def get_frame():
         headers={
             "X-Timestamp": timestamp,
             "X-Frame-Number": str(frame_count),
+            "X-Frame-Seq": str(seq),
             "X-Session-Path": session_path,
             "X-Saving-Active": str(saving),
         },
     )
 
 
+@app.get("/frame/raw")
+async def get_frame_raw():
+    """Latest color frame as raw BGR bytes (no JPEG) with shape headers."""
+    if not camera_manager:
+        raise HTTPException(status_code=500, detail="Camera not initialized")
+
+    with camera_manager._lock:
+        color = camera_manager.latest_color_image
+        timestamp = camera_manager.latest_timestamp
+        frame_count = camera_manager.frame_count
+        seq = camera_manager.frame_seq
+
+    if color is None:
+        raise HTTPException(status_code=503, detail="No frame captured yet")
+
+    h, w = color.shape[:2]
+    return Response(
+        content=color.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Timestamp": timestamp,
+            "X-Frame-Number": str(frame_count),
+            "X-Frame-Seq": str(seq),
+            "X-Width": str(w),
+            "X-Height": str(h),
+        },
+    )
+
+
 @app.post("/distance")
 async def get_distance(req: DistanceRequest):
     if not camera_manager:
@@ -441,6 +700,7 @@ async def get_session():
             "frame_limit": camera_manager.frame_limit,
             "saving_active": camera_manager.saving_active,
             "depth_scale": camera_manager.depth_scale,
+            "frame_ring": camera_manager.frame_ring_name,
         }
 
 
@@ -457,6 +717,11 @@ async def get_status():
             "frame_limit": camera_manager.frame_limit,
             "saving_active": camera_manager.saving_active,
             "depth_scale": camera_manager.depth_scale,
+            "frame_ring": camera_manager.frame_ring_name,
+            "frame_seq": camera_manager.frame_seq,
+            "jpeg_encodes": camera_manager.jpeg_encodes,
+            "pipeline": camera_manager.pipeline_status(),
+            "depth_codec": camera_manager.depth_codec_status(),
         }
 
 
@@ -493,6 +758,20 @@ if __name__ == "__main__":
                         help="Override dynamic frame limit")
     parser.add_argument("--no-save-depth", action="store_true",
                         help="Disable depth saving (saves disk space; depth still used for distance queries)")
+    parser.add_argument("--frame-ring", type=str, default=frame_ring.DEFAULT_NAME,
+                        help="Shared-memory segment (/dev/shm/NAME) the color and depth frames "
+                             f"are published to (default: {frame_ring.DEFAULT_NAME})")
+    parser.add_argument("--frame-ring-slots", type=int, default=frame_ring.DEFAULT_SLOTS,
+                        help=f"Frames kept in the ring (default: {frame_ring.DEFAULT_SLOTS})")
+    parser.add_argument("--no-frame-ring", action="store_true",
+                        help="Do not publish frames to shared memory (HTTP /frame only)")
+    parser.add_argument("--depth-codec", type=str, default="npy",
+                        help="Saved depth format: npy, png16, delta-zlib, delta-zstd, delta-lz4, "
+                             "or delta-*:<mm> for lossy mm quantization (default: npy; pick with "
+                             "bench_depth_codec.py on the Jetson)")
+    parser.add_argument("--loose-frames", action="store_true",
+                        help="Save one rgb/<ts>.jpg + depth/<ts>.npy|.depth per frame instead of "
+                             "append-only frame packs")
     cli_args = parser.parse_args()
 
     print(f"Starting Camera Server on port {cli_args.port}...")
@@ -19,6 +19,9 @@ from pathlib import Path
 import cv2
 import numpy as np
 
+import depth_codec
+import depth_stats
+import frame_pack
 from hud import load_hud_config, draw_hud
 
 try:
@@ -703,18 +706,29 @@ def _draw_log_lines(frame, debug_info):
                     color, ft, cv2.LINE_AA)
 
 
+def _read_color(source):
+    """BGR frame from a frame_pack.list_frames() source (loose .jpg or pack entry)."""
+    data = np.frombuffer(frame_pack.read_bytes(source), np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def _read_depth(source):
+    """Depth map from a loose file or pack entry, any depth_codec; ValueError if truncated/corrupt."""
+    return depth_codec.decode(frame_pack.read_bytes(source))
+
+
 def _process_frame(args):
     """Process a single frame (runs in worker process)."""
-    rgb_path, depth_path, detections, track_state, debug_info, elapsed_sec = args
-    frame = cv2.imread(rgb_path)
+    rgb_source, depth_source, detections, track_state, debug_info, elapsed_sec = args
+    frame = _read_color(rgb_source)
     if frame is None:
         return None, False
 
     depth_image = None
     depth_skipped = False
-    if depth_path is not None:
+    if depth_source is not None:
         try:
-            depth_image = np.load(depth_path)
+            depth_image = _read_depth(depth_source)
         except ValueError:
             depth_image = None
             depth_skipped = True
@@ -750,9 +764,12 @@ def main():
     parser.add_argument("--max-yolo-gap", type=float, default=3.0,
                         help="Max seconds to reuse a YOLO detection (default: 3.0)")
     parser.add_argument("--frame", type=str, default=None,
-                        help="Render single frame from this depth file (saves PNG)")
+                        help="Render single frame from this depth file or timestamp (saves PNG)")
     parser.add_argument("--workers", type=int, default=0,
                         help="Parallel workers (default: auto)")
+    parser.add_argument("--redetections", action="store_true",
+                        help="Use yolo/redetections.jsonl (dense, from redetect_session.py) "
+                             "instead of the live yolo/detections.jsonl")
     parser.add_argument("--mesh3d", action="store_true",
                         help="Force-enable 3D mesh overlay regardless of hud_config.yaml setting "
                              "(requires open3d; configure via mesh3d section in hud_config.yaml)")
@@ -761,23 +778,23 @@ def main():
     session = Path(args.session)
     rgb_dir = session / "rgb"
     depth_dir = session / "depth"
-    yolo_file = session / "yolo" / "detections.jsonl"
+    yolo_file = session / "yolo" / ("redetections.jsonl" if args.redetections else "detections.jsonl")
 
     if not rgb_dir.exists():
         print(f"No rgb/ directory in {session}")
         sys.exit(1)
 
-    # Load RGB file list sorted by timestamp
-    rgb_files = sorted(rgb_dir.glob("*.jpg"))
-    if not rgb_files:
+    # RGB / depth frames sorted by timestamp: (seconds, source, name), from
+    # frame packs and/or loose files
+    rgb_timestamps = [(parse_timestamp(ts), source, ts)
+                      for ts, source in frame_pack.list_frames(rgb_dir, ".jpg")]
+    if not rgb_timestamps:
         print("No RGB frames found")
         sys.exit(1)
-    rgb_timestamps = [(parse_timestamp(f.stem), f) for f in rgb_files]
     print(f"RGB frames: {len(rgb_timestamps)}")
 
-    # Load depth file list sorted by timestamp
-    depth_files = sorted(depth_dir.glob("*.npy")) if depth_dir.exists() else []
-    depth_timestamps = [(parse_timestamp(f.stem), f) for f in depth_files]
+    depth_timestamps = [(parse_timestamp(ts), source, ts)
+                        for ts, source in frame_pack.list_frames(depth_dir, depth_codec.SUFFIXES)]
     print(f"Depth frames: {len(depth_timestamps)}")
 
     # Load YOLO detections
@@ -838,8 +855,13 @@ def main():
             print("No RGB frame found near that depth frame")
             sys.exit(1)
 
-        rgb_path = str(rgb_timestamps[rgb_idx][1])
-        depth_path = str(session / "depth" / Path(args.frame).name)
+        rgb_source, rgb_name = rgb_timestamps[rgb_idx][1:]
+        depth_idx = next((i for i, entry in enumerate(depth_timestamps) if entry[2] == depth_name),
+                         find_closest(depth_ts, depth_timestamps, args.max_depth_gap))
+        if depth_idx < 0:
+            print(f"No depth frame {depth_name}")
+            sys.exit(1)
+        depth_source = depth_timestamps[depth_idx][1]
 
         yolo_idx = find_closest(depth_ts, yolo_entries, args.max_yolo_gap)
         yolo_entry = yolo_entries[yolo_idx][1] if yolo_idx >= 0 else {}
@@ -858,8 +880,8 @@ def main():
                 track_ts = track_state.get("timestamp", "")
 
         debug_info = {
-            "rgb": Path(rgb_path).name,
-            "depth": Path(depth_path).name,
+            "rgb": rgb_name,
+            "depth": depth_timestamps[depth_idx][2],
             "yolo": yolo_ts or "-",
             "track": track_ts or "-",
         }
@@ -879,7 +901,7 @@ def main():
             mesh3d_cfg["enabled"] = False
         _init_worker(hud_cfg, mesh3d_cfg=mesh3d_cfg)
         elapsed = depth_ts - rgb_timestamps[0][0]
-        frame, _ = _process_frame((rgb_path, depth_path, detections, track_state, debug_info, elapsed))
+        frame, _ = _process_frame((rgb_source, depth_source, detections, track_state, debug_info, elapsed))
 
         out_base = args.output or f"/tmp/frame_{depth_name}.png"
         out_stem = out_base.rsplit(".", 1)[0]
@@ -887,8 +909,8 @@ def main():
         print(f"Saved: {out_base}")
 
         # Debug depth heatmaps — per-bbox, matching what the mesh sees
-        depth_image = np.load(depth_path)
-        img_h, img_w = cv2.imread(rgb_path).shape[:2]
+        depth_image = _read_depth(depth_source)
+        img_h, img_w = _read_color(rgb_source).shape[:2]
         dep_h, dep_w = depth_image.shape[:2]
         mesh_cfg = hud_cfg.get("mesh", {})
         gm = mesh_cfg.get("gamma", 1.0)
@@ -898,12 +920,10 @@ def main():
         dsx, dsy = dep_w / img_w, dep_h / img_h
 
         # Global linear heatmap (full frame, p5-p95)
-        d = depth_image.astype(np.float32)
-        d[d == 0] = np.nan
-        d_min_g, d_max_g = np.nanpercentile(d, [5, 95])
+        hist = depth_stats.DepthHistogram(depth_image)
+        d_min_g, d_max_g = hist.percentile([5, 95]) if hist.valid else (0.0, 0.0)
         d_range_g = max(d_max_g - d_min_g, 1)
-        linear = np.clip((d - d_min_g) / d_range_g, 0, 1)
-        linear = np.nan_to_num(linear, nan=0)
+        linear = np.clip((depth_image.astype(np.float32) - d_min_g) / d_range_g, 0, 1)
         hm_linear = cv2.applyColorMap((linear * 255).astype(np.uint8), cv2.COLORMAP_TURBO)
         hm_linear[depth_image == 0] = 0
 
@@ -926,16 +946,14 @@ def main():
             dy1 = max(0, int(by * dsy))
             dx2 = min(dep_w, int((bx + bw) * dsx))
             dy2 = min(dep_h, int((by + bh) * dsy))
-            region = depth_image[dy1:dy2, dx1:dx2].astype(np.float32)
-            region[region == 0] = np.nan
-            valid = region[~np.isnan(region)]
-            if len(valid) < 10:
+            hist = depth_stats.DepthHistogram(depth_image[dy1:dy2, dx1:dx2])
+            if hist.valid < 10:
                 continue
-            d_min_b = np.percentile(valid, pn)
-            d_max_b = np.percentile(valid, pf)
+            d_min_b, d_max_b = hist.percentile([pn, pf])
             d_range_b = max(d_max_b - d_min_b, 1)
+            # Zero pixels are blanked below, after the colormap
+            region = depth_image[dy1:dy2, dx1:dx2].astype(np.float32)
             closeness = np.clip(1.0 - (region - d_min_b) / d_range_b, 0, 1)
-            closeness = np.nan_to_num(closeness, nan=0)
             closeness = closeness ** gm
             closeness[closeness < co] = 0
             bbox_hm = cv2.applyColorMap((closeness * 255).astype(np.uint8), cv2.COLORMAP_TURBO)
@@ -960,7 +978,7 @@ def main():
     print(f"Output FPS: {fps:.1f}")
 
     # Read first frame to get dimensions
-    first_frame = cv2.imread(str(rgb_timestamps[0][1]))
+    first_frame = _read_color(rgb_timestamps[0][1])
     h, w = first_frame.shape[:2]
 
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
@@ -974,9 +992,9 @@ def main():
 
     session_start_ts = rgb_timestamps[0][0]
     frame_args = []
-    for rgb_ts, rgb_path in rgb_timestamps:
+    for rgb_ts, rgb_source, rgb_name in rgb_timestamps:
         depth_idx = find_closest(rgb_ts, depth_timestamps, args.max_depth_gap)
-        depth_path = str(depth_timestamps[depth_idx][1]) if depth_idx >= 0 else None
+        depth_source = depth_timestamps[depth_idx][1] if depth_idx >= 0 else None
 
         yolo_idx = find_closest(rgb_ts, yolo_entries, args.max_yolo_gap)
         yolo_entry = yolo_entries[yolo_idx][1] if yolo_idx >= 0 else {}
@@ -996,15 +1014,15 @@ def main():
             track_state = dict(last_track_state)
 
         debug_info = {
-            "rgb": Path(rgb_path).name,
-            "depth": Path(depth_path).name if depth_path else "-",
+            "rgb": rgb_name,
+            "depth": depth_timestamps[depth_idx][2] if depth_source is not None else "-",
             "yolo": yolo_ts or "-",
             "track": track_ts or "-",
         }
         for name, entries in log_sources.items():
             debug_info[f"log_{name}"] = find_most_recent(rgb_ts, entries)
         elapsed_sec = rgb_ts - session_start_ts
-        frame_args.append((str(rgb_path), depth_path, detections, track_state, debug_info, elapsed_sec))
+        frame_args.append((rgb_source, depth_source, detections, track_state, debug_info, elapsed_sec))
 
     # Parallel processing
     n_workers = args.workers if args.workers > 0 else min(os.cpu_count() or 4, 8)
@@ -1054,7 +1072,7 @@ def main():
           f"{len(rgb_timestamps)/duration:.1f} actual fps")
     print(f"Composed in {total_time:.1f}s ({n_frames/total_time:.1f} compose fps)")
     if depth_skipped_count > 0:
-        print(f"WARNING: {depth_skipped_count} depth frame(s) skipped (truncated/corrupt .npy files)")
+        print(f"WARNING: {depth_skipped_count} depth frame(s) skipped (truncated/corrupt depth files)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+"""Depth frame codecs for session recording.
+
+Depth maps are uint16 (D435 units: millimetres at the default depth
+scale). Codecs, selected with camera_server --depth-codec:
+  npy               raw np.save bytes (the original format)
+  png16             lossless 16-bit PNG (OpenCV)
+  delta-zlib        lossless: per-row deltas, byte planes split, zlib
+  delta-zstd        same with zstd (needs zstandard)
+  delta-lz4         same with LZ4 (needs lz4)
+  delta-*:<mm>      lossy: depth rounded to <mm> steps first (e.g.
+                    delta-zstd:10); zero (no reading) stays zero and
+                    a reading never becomes zero: depths below half a
+                    step come back as one step, error up to step - 1
+
+Everything except npy is written with a small self-describing header, so
+decode() needs no configuration and also reads plain .npy bytes.
+bench_depth_codec.py reports ratio and encode/decode cost per codec.
+"""
+import io
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+NPY_MAGIC = b"\x93NUMPY"
+MAGIC = b"DEP1"
+# magic, codec, compressor, height, width, quantization step (mm)
+_HEADER = struct.Struct("<4sBBHHH")
+
+_PNG16, _DELTA = 1, 2
+_COMPRESSORS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+
+# Loose-file suffixes (frame_pack.list_frames): npy keeps .npy, the rest .depth
+NPY_SUFFIX = ".npy"
+SUFFIX = ".depth"
+SUFFIXES = (NPY_SUFFIX, SUFFIX)
+
+ZLIB_LEVEL = 1      # Level 1 keeps the Jetson writer thread ahead of 60 fps
+ZSTD_LEVEL = 3
+
+CODECS = ("npy", "png16", "delta-zlib", "delta-zstd", "delta-lz4")
+
+
+def _compressor(name):
+    """(compress, decompress) for a compressor name; ImportError if not installed."""
+    if name == "none":
+        return bytes, bytes
+    if name == "zlib":
+        def compress(data):
+            # Run-length matching only: deltas have few long-range repeats,
+            # and Z_RLE is both faster and smaller than the default here
+            c = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, 15, 8, zlib.Z_RLE)
+            return c.compress(data) + c.flush()
+        return compress, zlib.decompress
+    if name == "zstd":
+        import zstandard
+        return (zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress,
+                zstandard.ZstdDecompressor().decompress)
+    if name == "lz4":
+        import lz4.frame
+        return lz4.frame.compress, lz4.frame.decompress
+    raise ValueError("Unknown compressor: {}".format(name))
+
+
+def _delta_planes(depth):
+    """Row deltas (wrapping uint16, so lossless) as a low-byte plane then a high-byte plane."""
+    delta = np.empty_like(depth)
+    delta[:, 0] = depth[:, 0]
+    np.subtract(depth[:, 1:], depth[:, :-1], out=delta[:, 1:])
+    return np.ascontiguousarray(delta.view(np.uint8).reshape(-1, 2).T).tobytes()
+
+
+def _undelta_planes(data, height, width):
+    planes = np.frombuffer(data, np.uint8).reshape(2, -1)
+    delta = np.ascontiguousarray(planes.T).view(np.uint16).reshape(height, width)
+    return np.cumsum(delta, axis=1, dtype=np.uint16)
+
+
+class DepthCodec:
+    """Encoder for one codec spec (see module docstring)."""
+
+    def __init__(self, spec="npy"):
+        self.spec = spec
+        name, _, step = spec.partition(":")
+        self.step = int(step) if step else 1
+        if name == "npy" or name == "png16":
+            if step:
+                raise ValueError("{} has no quantization step".format(name))
+            self.kind, self.compressor = name, "none"
+        elif name.startswith("delta-") and name[len("delta-"):] in _COMPRESSORS:
+            self.kind, self.compressor = "delta", name[len("delta-"):]
+        else:
+            raise ValueError("Unknown depth codec: {} (choose from {})".format(spec, ", ".join(CODECS)))
+        if not 1 <= self.step <= 1000:
+            raise ValueError("Quantization step must be 1-1000 mm")
+        self._compress = _compressor(self.compressor)[0]
+        self.lossy = self.step > 1
+        self.suffix = NPY_SUFFIX if self.kind == "npy" else SUFFIX
+
+    def encode(self, depth):
+        depth = np.ascontiguousarray(depth, dtype=np.uint16)
+        if self.kind == "npy":
+            buf = io.BytesIO()
+            np.save(buf, depth)
+            return buf.getvalue()
+        height, width = depth.shape
+        if self.kind == "png16":
+            ok, png = cv2.imencode(".png", depth, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            if not ok:
+                raise ValueError("PNG encode failed")
+            return _HEADER.pack(MAGIC, _PNG16, 0, height, width, 1) + png.tobytes()
+        if self.lossy:
+            quantized = np.minimum((depth.astype(np.uint32) + self.step // 2) // self.step,
+                                   0xFFFF // self.step).astype(np.uint16)
+            # Rounding would turn depths below step/2 into "no reading"
+            depth = np.maximum(quantized, depth > 0, dtype=np.uint16)
+        return (_HEADER.pack(MAGIC, _DELTA, _COMPRESSORS[self.compressor], height, width, self.step)
+                + self._compress(_delta_planes(depth)))
+
+
+def decode(data):
+    """Depth map from any codec's bytes (or a plain .npy); ValueError if corrupt."""
+    if data[:len(NPY_MAGIC)] == NPY_MAGIC:
+        return np.load(io.BytesIO(data))
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated depth frame")
+    magic, codec, compressor, height, width, step = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a depth frame")
+    body = memoryview(data)[_HEADER.size:]
+    if codec == _PNG16:
+        depth = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_UNCHANGED)
+        if depth is None or depth.shape != (height, width):
+            raise ValueError("Corrupt PNG depth frame")
+        return depth
+    if codec != _DELTA:
+        raise ValueError("Unknown depth codec id {}".format(codec))
+    name = {v: k for k, v in _COMPRESSORS.items()}.get(compressor)
+    if name is None:
+        raise ValueError("Unknown compressor id {}".format(compressor))
+    try:
+        raw = _compressor(name)[1](bytes(body))
+    except Exception as e:  # zlib.error, zstandard.ZstdError, lz4's RuntimeError
+        raise ValueError("Corrupt depth frame: {}".format(e))
+    if len(raw) != height * width * 2:
+        raise ValueError("Corrupt depth frame: size mismatch")
+    depth = _undelta_planes(raw, height, width)
+    if step > 1:
+        depth *= step
+    return depth
+
+
+def available():
+    """Codec names usable in this environment (optional compressors installed)."""
+    names = []
+    for name in CODECS:
+        try:
+            DepthCodec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
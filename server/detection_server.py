@@ -19,15 +19,22 @@ import aiohttp
 import cv2
 import numpy as np
 import uvicorn
-from fastapi import FastAPI
+import yaml
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
 
 # Config lives in the client directory
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'client'))
 from config import (
     CAMERA_SERVER_URL, YOLO_URL,
     DETECTION_CONFIDENCE_MIN, CAMERA_FOV,
-    DEPTH_BBOX_SHRINK,
+    DEPTH_BBOX_SHRINK, DETECTION_RAW_FRAMES, DETECTION_TARGET_CLASSES_ONLY,
+    DETECTION_ROI_ENABLED, DETECTION_ROI_SIZE, DETECTION_ROI_MARGIN,
+    DETECTION_ROI_FULL_EVERY, DETECTION_SEARCH_BUDGET_MS, DETECTION_SMALL_TARGET_PX,
+    DETECTION_BINARY, DETECTION_FRAME_RING,
 )
+import detection_codec
+import frame_ring
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(name)s %(levelname)s %(message)s')
@@ -35,6 +42,13 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# After YOLO reports it cannot map the frame ring, or fails this many ring
+# frames in a row, use HTTP frames this long before trying the ring again
+# (YOLO or camera_server may have restarted, or YOLO is too loaded to read
+# ring frames before camera_server overwrites them)
+FRAME_RING_RETRY_S = 10.0
+FRAME_RING_MAX_FAILURES = 5
+
 
 @dataclass
 class Detection:
@@ -58,50 +72,208 @@ _cache_lock: asyncio.Lock = asyncio.Lock()
 _loop_fps: float = 0.0
 _last_result_age_ms: float = 0.0
 _cache_has_detections: bool = False
+_roi_active: bool = False
+_frame_source: str = ''
+_input_size: int = 0          # YOLO input side of the last result (SizeController / ROI choice)
+
+
+def _target_labels() -> List[str]:
+    path = os.path.join(os.path.dirname(__file__), '..', 'targets.yaml')
+    with open(path) as f:
+        return [t['name'] for t in yaml.safe_load(f).get('targets', [])]
+
+
+def _yolo_params() -> dict:
+    """Query parameters restricting YOLO to targets.yaml labels, if enabled."""
+    if not DETECTION_TARGET_CLASSES_ONLY:
+        return {}
+    labels = _target_labels()
+    logger.info(f"YOLO class filter: {labels}")
+    return {'classes': ','.join(labels)}
+
+
+def _roi_around(bbox: List[int], frame_w: int, frame_h: int) -> Optional[List[int]]:
+    """Square crop around bbox, grown by DETECTION_ROI_MARGIN and clamped to the frame.
+
+    Returns [x, y, w, h], or None when the crop would cover most of the frame
+    anyway (close targets) and full-frame inference is just as cheap.
+    """
+    x, y, w, h = bbox
+    side = int(max(w, h) * (1.0 + 2.0 * DETECTION_ROI_MARGIN))
+    side = max(side, DETECTION_ROI_SIZE)
+    if side >= min(frame_w, frame_h):
+        return None
+    cx, cy = x + w / 2.0, y + h / 2.0
+    x0 = int(min(max(cx - side / 2.0, 0), frame_w - side))
+    y0 = int(min(max(cy - side / 2.0, 0), frame_h - side))
+    return [x0, y0, side, side]
+
+
+def _tracked_bbox(detections: List['Detection'], labels: List[str]) -> Optional[List[int]]:
+    """Bbox of the most confident target-class detection, if any is confident enough."""
+    best = None
+    for d in detections:
+        if d.confidence >= DETECTION_CONFIDENCE_MIN and d.label in labels:
+            if best is None or d.confidence > best.confidence:
+                best = d
+    return best.bbox if best else None
+
+
+async def _fetch_frame(session: aiohttp.ClientSession):
+    """Latest frame over HTTP from camera_server (raw BGR or JPEG).
+
+    Returns (frame_ts, image_data, raw_headers, width, height), or None.
+    """
+    frame_url = f"{CAMERA_SERVER_URL}/frame/raw" if DETECTION_RAW_FRAMES \
+        else f"{CAMERA_SERVER_URL}/frame"
+    try:
+        async with session.get(frame_url) as resp:
+            if resp.status != 200:
+                return None
+            image_data = await resp.read()
+            frame_ts = resp.headers.get('X-Timestamp', '')
+            # X-Timestamp lets YOLO serve a repeated frame from its cache
+            raw_headers = {k: resp.headers.get(k, '')
+                           for k in ('X-Width', 'X-Height', 'X-Timestamp')}
+    except Exception as e:
+        logger.warning(f"Frame fetch failed: {e}")
+        return None
+
+    if DETECTION_RAW_FRAMES:
+        # Raw BGR: width comes from the header, nothing to decode
+        try:
+            frame_width = int(raw_headers['X-Width'])
+            frame_height = int(raw_headers['X-Height'])
+        except ValueError:
+            return None
+    else:
+        # Decode JPEG to get frame width for centroid normalisation
+        arr = np.frombuffer(image_data, dtype=np.uint8)
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        frame_height, frame_width = img.shape[:2]
+    return frame_ts, image_data, raw_headers, frame_width, frame_height
 
 
 async def _inference_loop() -> None:
-    global _cache, _loop_fps, _last_result_age_ms, _cache_has_detections
+    global _cache, _loop_fps, _last_result_age_ms, _cache_has_detections, _roi_active
+    global _frame_source, _input_size
     fps_window: List[float] = []
+    yolo_params = _yolo_params()
+    # Realtime lane in YOLO's admission queue; a newer frame supersedes a queued older one
+    yolo_headers = {'X-Priority': 'realtime', 'X-Client-Id': 'detection_server'}
+    if DETECTION_BINARY:
+        yolo_headers['Accept'] = detection_codec.MEDIA_TYPE
+    # ROI tracking: crop around the last confident target at a reduced YOLO
+    # input size; full frame every DETECTION_ROI_FULL_EVERY loops and on loss.
+    # Input size otherwise: latency budget while searching, full 640 for a
+    # small (far) tracked target.
+    target_labels = _target_labels()
+    tracked_bbox: Optional[List[int]] = None
+    frames_since_full = 0
+    # Shared-memory frames from camera_server when it runs on this host
+    ring = frame_ring.FrameRingReader(DETECTION_FRAME_RING) if DETECTION_FRAME_RING else None
+    last_seq = 0
+    ring_retry_at = 0.0
+    ring_failures = 0
 
     async with aiohttp.ClientSession() as session:
         while True:
             loop_start = time.time()
 
-            # 1. Fetch frame from camera server
-            try:
-                async with session.get(f"{CAMERA_SERVER_URL}/frame") as resp:
-                    if resp.status != 200:
-                        continue
-                    image_data = await resp.read()
-                    frame_ts = resp.headers.get('X-Timestamp', '')
-            except Exception as e:
-                logger.warning(f"Frame fetch failed: {e}")
-                continue
-
-            # Decode JPEG to get frame width for centroid normalisation
-            arr = np.frombuffer(image_data, dtype=np.uint8)
-            img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            if img is None:
-                continue
-            frame_width = img.shape[1]
+            # 1. Latest frame: from the shared-memory ring (YOLO maps the
+            # same slot, only its sequence number crosses HTTP), else over
+            # HTTP from camera server
+            ring_frame = None
+            if ring is not None and loop_start >= ring_retry_at:
+                ring_frame = ring.latest()
+            if ring_frame is not None:
+                if ring_frame.seq == last_seq:
+                    await asyncio.sleep(0.002)  # Nothing new since the last loop
+                    continue
+                last_seq = ring_frame.seq
+                frame_ts = ring_frame.timestamp
+                frame_height, frame_width = ring_frame.color.shape[:2]
+            else:
+                fetched = await _fetch_frame(session)
+                if fetched is None:
+                    continue
+                frame_ts, image_data, raw_headers, frame_width, frame_height = fetched
+            _frame_source = 'ring' if ring_frame is not None else 'http'
+
+            params = dict(yolo_params)
+            roi = None
+            if (DETECTION_ROI_ENABLED and tracked_bbox is not None
+                    and frames_since_full < DETECTION_ROI_FULL_EVERY):
+                roi = _roi_around(tracked_bbox, frame_width, frame_height)
+            if roi is not None:
+                params['roi'] = ','.join(str(v) for v in roi)
+                params['size'] = str(DETECTION_ROI_SIZE)
+                frames_since_full += 1
+            else:
+                frames_since_full = 0
+                if tracked_bbox is None:
+                    if DETECTION_SEARCH_BUDGET_MS:
+                        params['budget_ms'] = str(DETECTION_SEARCH_BUDGET_MS)
+                elif max(tracked_bbox[2], tracked_bbox[3]) < DETECTION_SMALL_TARGET_PX:
+                    params['size'] = '640'
+            _roi_active = roi is not None
 
             # 2. YOLO inference
             try:
-                async with session.post(
-                        f"{YOLO_URL}/detect/",
-                        data={'file': image_data}) as resp:
+                if ring_frame is not None:
+                    # X-Timestamp lets YOLO serve a repeated frame from its cache
+                    yolo_request = session.post(f"{YOLO_URL}/detect/shm", params=params,
+                                                json={'ring': DETECTION_FRAME_RING,
+                                                      'seq': ring_frame.seq},
+                                                headers={'X-Timestamp': frame_ts, **yolo_headers})
+                elif DETECTION_RAW_FRAMES:
+                    yolo_request = session.post(f"{YOLO_URL}/detect/raw", params=params,
+                                                data=image_data,
+                                                headers={**raw_headers, **yolo_headers})
+                else:
+                    yolo_request = session.post(f"{YOLO_URL}/detect/", params=params,
+                                                data={'file': image_data},
+                                                headers={'X-Timestamp': frame_ts, **yolo_headers})
+                async with yolo_request as resp:
+                    if ring_frame is not None and resp.status in (400, 404):
+                        # 404: YOLO cannot map the ring (different host or /dev/shm).
+                        # 400: frame overwritten before YOLO copied it; once is a
+                        # skipped frame, repeatedly means the ring is no use now.
+                        # Either way HTTP frames for a while, then the ring again.
+                        ring_failures += 1
+                        if resp.status == 404 or ring_failures >= FRAME_RING_MAX_FAILURES:
+                            logger.warning(f"YOLO cannot read frame ring, HTTP frames for "
+                                           f"{FRAME_RING_RETRY_S:.0f}s: {await resp.text()}")
+                            ring_retry_at = time.time() + FRAME_RING_RETRY_S
+                            ring_failures = 0
+                        continue
+                    if ring_frame is not None and resp.status == 200:
+                        ring_failures = 0
                     if resp.status != 200:
                         continue
-                    yolo_result = await resp.json()
+                    if resp.content_type == detection_codec.MEDIA_TYPE:
+                        # Column-wise from the record array, no per-detection dicts
+                        decoded = detection_codec.decode(await resp.read())
+                        records = decoded.records
+                        yolo_detections = list(zip(
+                            [decoded.labels[i] for i in records['label_id']],
+                            records['confidence'].tolist(), records['bbox'].tolist()))
+                        _input_size = decoded.input_size
+                    else:
+                        body = await resp.json()
+                        yolo_detections = [(d['label'], d['confidence'], d['bbox'])
+                                           for d in body.get('detections', [])]
+                        _input_size = body.get('input_size', 0)
             except Exception as e:
                 logger.warning(f"YOLO inference failed: {e}")
                 continue
 
             # 3. Process all detections (depth only for high-confidence ones)
             detections: List[Detection] = []
-            for d in yolo_result.get('detections', []):
-                bbox = d['bbox']  # [x, y, w, h]
+            for label, confidence, bbox in yolo_detections:
+                # bbox: [x, y, w, h]
                 centroid_x = bbox[0] + bbox[2] / 2.0
                 centroid_x_norm = 1.0 - (centroid_x / frame_width)
 
@@ -109,7 +281,7 @@ async def _inference_loop() -> None:
                 # keep the loop fast; low-confidence ones are saved for
                 # offline analysis / HUD visualization with distance=None.
                 distance: Optional[float] = None
-                if d['confidence'] >= DETECTION_CONFIDENCE_MIN:
+                if confidence >= DETECTION_CONFIDENCE_MIN:
                     try:
                         async with session.post(
                                 f"{CAMERA_SERVER_URL}/distance",
@@ -128,14 +300,18 @@ async def _inference_loop() -> None:
                 relative_position_deg = (0.5 - centroid_x_norm) * CAMERA_FOV
 
                 detections.append(Detection(
-                    label=d['label'],
-                    confidence=d['confidence'],
+                    label=label,
+                    confidence=confidence,
                     bbox=bbox,
                     centroid_x_norm=centroid_x_norm,
                     distance=distance,
                     relative_position_deg=relative_position_deg,
                 ))
 
+            # Lost (in the crop or the full frame) → next frame goes
+            # full-frame at the search budget
+            tracked_bbox = _tracked_bbox(detections, target_labels)
+
             # 4. Write to cache
             new_result = DetectionResult(
                 timestamp=time.time(),
@@ -160,10 +336,18 @@ async def startup() -> None:
 
 
 @app.get("/detection")
-async def get_detection():
-    """Return last cached detection result instantly (no I/O, microsecond latency)."""
+async def get_detection(request: Request):
+    """Return last cached detection result instantly (no I/O, microsecond latency).
+
+    JSON by default; the compact binary format with
+    Accept: application/x-detections (see client/detection_codec.py).
+    """
     async with _cache_lock:
         result = _cache
+    if detection_codec.wants_binary(request.headers.get('accept')):
+        payload = detection_codec.encode([vars(d) for d in result.detections],
+                                         timestamp=result.timestamp, frame_ts=result.frame_ts)
+        return Response(payload, media_type=detection_codec.MEDIA_TYPE)
     return {
         "timestamp": result.timestamp,
         "frame_ts": result.frame_ts,
@@ -178,6 +362,9 @@ async def get_status():
         "loop_fps": round(_loop_fps, 1),
         "last_result_age_ms": round(_last_result_age_ms, 1),
         "cache_has_detections": _cache_has_detections,
+        "roi_active": _roi_active,
+        "frame_source": _frame_source,
+        "input_size": _input_size,
     }
 
 
@@ -0,0 +1,165 @@
+"""Append-only frame packs: a session stream as a few large files.
+
+A stream directory (sessions/<ts>/rgb, sessions/<ts>/depth) holds
+    frames-00000.pack, frames-00001.pack, ...   concatenated payloads
+    frames.idx                                  INDEX_RECORD per frame
+instead of one <ts>.jpg / <ts>.npy per frame. Payloads are stored as they
+would be written to the loose files (JPEG bytes, depth_codec bytes). A
+segment is closed once it reaches SEGMENT_BYTES.
+
+The index is append-only and written after the payload, so a crash can
+only lose the frame being written; a torn last record is ignored. Readers
+re-read the index when asked for a frame past its end, so a pack being
+recorded can be read while it grows.
+
+list_frames() covers both layouts (and a mix of them) so tools take any
+session; pack_session.py converts old sessions. Python 3.6 compatible.
+"""
+import os
+import struct
+from collections import namedtuple
+
+SEGMENT_BYTES = 256 * 1024 * 1024
+INDEX_NAME = "frames.idx"
+SEGMENT_NAME = "frames-{:05d}.pack"
+
+# timestamp (file stem, "20260307_100125_257409"), segment, offset, length
+INDEX_RECORD = struct.Struct("<22s2xIQI")
+
+PackRef = namedtuple("PackRef", "directory index")
+
+
+def is_pack(directory):
+    """True if a stream directory holds a frame pack."""
+    return os.path.exists(os.path.join(str(directory), INDEX_NAME))
+
+
+class FramePackWriter:
+    """Appends frames to a stream directory; resumes an existing pack."""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        self.count = 0
+        self.segment = 0
+        if os.path.exists(index_path):
+            size = os.path.getsize(index_path)
+            self.count = size // INDEX_RECORD.size
+            if size % INDEX_RECORD.size:
+                # Torn record from a crash: cut it so new records stay aligned
+                with open(index_path, "r+b") as f:
+                    f.truncate(self.count * INDEX_RECORD.size)
+            if self.count:
+                with open(index_path, "rb") as f:
+                    f.seek((self.count - 1) * INDEX_RECORD.size)
+                    self.segment = INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[1]
+        self._index = open(index_path, "ab")
+        self._open_segment()
+
+    def _open_segment(self):
+        self._data = open(os.path.join(self.directory, SEGMENT_NAME.format(self.segment)), "ab")
+        self._offset = self._data.tell()
+
+    def append(self, timestamp, payload):
+        """Store one frame; timestamp is the frame's file stem."""
+        if self._offset and self._offset + len(payload) > self.segment_bytes:
+            self._data.close()
+            self.segment += 1
+            self._open_segment()
+        self._data.write(payload)
+        self._data.flush()
+        self._index.write(INDEX_RECORD.pack(timestamp.encode(), self.segment,
+                                            self._offset, len(payload)))
+        self._index.flush()
+        self._offset += len(payload)
+        self.count += 1
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class FramePackReader:
+    """Random access to the frames of a stream directory."""
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.timestamps = []
+        self._entries = []
+        self._files = {}
+        self.refresh()
+
+    def refresh(self):
+        """Pick up frames appended since the index was last read."""
+        with open(os.path.join(self.directory, INDEX_NAME), "rb") as f:
+            f.seek(len(self._entries) * INDEX_RECORD.size)
+            data = f.read()
+        for i in range(len(data) // INDEX_RECORD.size):
+            ts, segment, offset, length = INDEX_RECORD.unpack_from(data, i * INDEX_RECORD.size)
+            self.timestamps.append(ts.decode())
+            self._entries.append((segment, offset, length))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read(self, index):
+        """Payload bytes of frame index."""
+        if index >= len(self._entries):
+            self.refresh()
+        segment, offset, length = self._entries[index]
+        fd = self._files.get(segment)
+        if fd is None:
+            fd = self._files[segment] = os.open(
+                os.path.join(self.directory, SEGMENT_NAME.format(segment)), os.O_RDONLY)
+        return os.pread(fd, length, offset)
+
+    def close(self):
+        for fd in self._files.values():
+            os.close(fd)
+        self._files = {}
+
+
+# Per-process readers, so PackRefs can be handed to worker processes
+_readers = {}
+
+
+def _reader(directory):
+    reader = _readers.get(directory)
+    if reader is None:
+        reader = _readers[directory] = FramePackReader(directory)
+    return reader
+
+
+def list_frames(directory, suffix):
+    """Sorted [(timestamp, source)] of a stream directory, packed and/or loose.
+
+    suffix is the loose-file suffix (or a tuple of them). source is a loose
+    file path (str) or a PackRef; read_bytes() takes either. A frame both
+    packed and loose (pack_session.py without --remove) is listed once, from
+    the pack.
+    """
+    directory = str(directory)
+    frames = []
+    if is_pack(directory):
+        reader = _reader(directory)
+        reader.refresh()
+        frames = [(ts, PackRef(directory, i)) for i, ts in enumerate(reader.timestamps)]
+    if os.path.isdir(directory):
+        suffixes = (suffix,) if isinstance(suffix, str) else tuple(suffix)
+        packed = set(ts for ts, _ in frames)
+        for name in os.listdir(directory):
+            stem = os.path.splitext(name)[0]
+            if name.endswith(suffixes) and stem not in packed:
+                frames.append((stem, os.path.join(directory, name)))
+    frames.sort(key=lambda frame: frame[0])
+    return frames
+
+
+def read_bytes(source):
+    """Payload of a frame source from list_frames()."""
+    if isinstance(source, PackRef):
+        return _reader(source.directory).read(source.index)
+    with open(source, "rb") as f:
+        return f.read()
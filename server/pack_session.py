@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Convert a session from one file per frame to frame packs (frame_pack.py).
+
+rgb/<ts>.jpg and depth/<ts>.npy|.depth are appended, in timestamp order,
+to rgb/frames-*.pack and depth/frames-*.pack with their indexes. Frames
+already in a pack are skipped, so an interrupted conversion can simply be
+run again. --depth-codec re-encodes depth on the way (depth_codec.py).
+Loose files are only deleted with --remove, after every frame of the
+stream has been read back from the pack.
+
+Usage:
+    python3 pack_session.py sessions/20260405_115449
+    python3 pack_session.py sessions/* --remove --depth-codec delta-zlib
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import depth_codec
+import frame_pack
+
+STREAMS = (("rgb", (".jpg",)), ("depth", depth_codec.SUFFIXES))
+
+
+def same_depth(packed: bytes, original: bytes, codec) -> bool:
+    """Re-encoded depth matches the original (exactly, or as codec quantizes it)."""
+    a, b = depth_codec.decode(packed), depth_codec.decode(original)
+    if a.shape != b.shape:
+        return False
+    if codec.lossy:
+        b = depth_codec.decode(codec.encode(b))
+    return bool(np.array_equal(a, b))
+
+
+def pack_stream(directory: Path, suffixes: tuple, remove: bool, segment_bytes: int,
+                codec=None):
+    """Pack one stream directory, re-encoding payloads with codec if given.
+
+    Returns (frames packed, bytes packed).
+    """
+    loose = sorted((p for p in directory.glob("*") if p.suffix in suffixes),
+                   key=lambda p: p.stem)
+    if not loose:
+        return 0, 0
+    packed = set()
+    if frame_pack.is_pack(directory):
+        packed = set(frame_pack.FramePackReader(directory).timestamps)
+    todo = [p for p in loose if p.stem not in packed]
+
+    writer = frame_pack.FramePackWriter(directory, segment_bytes)
+    total = 0
+    try:
+        for path in todo:
+            data = path.read_bytes()
+            if codec is not None:
+                data = codec.encode(depth_codec.decode(data))
+            writer.append(path.stem, data)
+            total += len(data)
+    finally:
+        writer.close()
+
+    # Until --remove the loose files stay next to the pack; tools must still
+    # see every frame exactly once, read from the pack
+    listed = frame_pack.list_frames(directory, suffixes)
+    if (len(set(ts for ts, _ in listed)) != len(listed)
+            or not all(isinstance(source, frame_pack.PackRef) for _, source in listed)):
+        sys.exit(f"{directory}: frames listed twice or outside the pack after packing")
+
+    if remove:
+        reader = frame_pack.FramePackReader(directory)
+        index = {ts: i for i, ts in enumerate(reader.timestamps)}
+        for path in loose:
+            i = index.get(path.stem)
+            if i is None:
+                mismatch = True
+            elif codec is not None:
+                mismatch = not same_depth(reader.read(i), path.read_bytes(), codec)
+            else:
+                mismatch = reader.read(i) != path.read_bytes()
+            if mismatch:
+                reader.close()
+                sys.exit(f"{path}: pack does not match the loose file, nothing removed")
+        reader.close()
+        for path in loose:
+            path.unlink()
+    return len(todo), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert sessions to frame packs")
+    parser.add_argument("sessions", nargs="+", help="Session directories")
+    parser.add_argument("--remove", action="store_true",
+                        help="Delete the loose frame files once verified against the pack")
+    parser.add_argument("--depth-codec", type=str, default=None,
+                        help="Re-encode depth with this codec (e.g. delta-zlib; default: as recorded)")
+    parser.add_argument("--segment-mb", type=int, default=frame_pack.SEGMENT_BYTES // 2**20,
+                        help=f"Pack segment size (default: {frame_pack.SEGMENT_BYTES // 2**20} MB)")
+    args = parser.parse_args()
+
+    codec = depth_codec.DepthCodec(args.depth_codec) if args.depth_codec else None
+    for session in map(Path, args.sessions):
+        if not (session / "rgb").is_dir():
+            print(f"{session}: no rgb/ directory, skipped")
+            continue
+        t0 = time.time()
+        for stream, suffixes in STREAMS:
+            count, size = pack_stream(session / stream, suffixes, args.remove,
+                                      args.segment_mb * 2**20,
+                                      codec if stream == "depth" else None)
+            if count:
+                print(f"{session}/{stream}: {count} frames, {size / 1e6:.1f} MB packed")
+        print(f"{session}: done in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
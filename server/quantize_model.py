@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Produce quantized variants of the YOLOv5 ONNX model for CPU inference.
+
+Variants (written next to the input model unless --out-dir is given):
+  int8-dynamic  weights INT8, activations quantized at runtime (no calibration)
+  int8-static   weights and activations INT8 (QDQ), calibrated on session frames
+  fp16          FP16 weights with float32 I/O (needs onnxconverter-common)
+
+Serve a variant with:
+    python3 yolo_server.py --engine onnxruntime --model config_files/yolov5s-int8-static.onnx
+and compare variants against FP32 with bench_quantized.py.
+
+Usage:
+    python3 quantize_model.py --variant int8-dynamic
+    python3 quantize_model.py --variant int8-static --calibrate sessions/20260405_115449
+    python3 quantize_model.py --variant fp16
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import frame_pack
+import yolo_server
+
+VARIANTS = ("int8-dynamic", "int8-static", "fp16")
+
+
+class SessionCalibrationReader:
+    """Feeds letterboxed session frames to the static quantizer, one at a time.
+
+    Implements the onnxruntime CalibrationDataReader interface (get_next).
+    """
+
+    def __init__(self, session: Path, input_name: str, limit: int):
+        self.input_name = input_name
+        self.frames = iter(frame_pack.list_frames(session / "rgb", ".jpg")[:limit])
+
+    def get_next(self):
+        for _, source in self.frames:
+            img = cv2.imdecode(np.frombuffer(frame_pack.read_bytes(source), np.uint8),
+                               cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            canvas, _ = yolo_server.format_yolov5(img)
+            return {self.input_name: yolo_server.make_blob([canvas]).copy()}
+        return None
+
+
+def quantize(variant: str, model: Path, output: Path, calibrate: Path, limit: int):
+    if variant == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError:
+            sys.exit("fp16 needs: pip install onnx onnxconverter-common")
+        converted = float16.convert_float_to_float16(onnx.load(str(model)), keep_io_types=True)
+        onnx.save(converted, str(output))
+        return
+
+    try:
+        import onnxruntime as ort
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    except ImportError:
+        sys.exit("INT8 needs: pip install onnxruntime")
+
+    if variant == "int8-dynamic":
+        quantize_dynamic(str(model), str(output), weight_type=QuantType.QUInt8)
+        return
+
+    if calibrate is None:
+        sys.exit("int8-static needs --calibrate SESSION_DIR")
+    input_name = ort.InferenceSession(str(model), providers=["CPUExecutionProvider"]) \
+        .get_inputs()[0].name
+    reader = SessionCalibrationReader(calibrate, input_name, limit)
+    quantize_static(str(model), str(output), reader,
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the YOLOv5 ONNX model")
+    parser.add_argument("--variant", choices=VARIANTS, required=True)
+    parser.add_argument("--model", type=str, default=yolo_server.MODEL_PATH,
+                        help=f"FP32 ONNX model (default: {yolo_server.MODEL_PATH})")
+    parser.add_argument("--out-dir", type=str, default=None,
+                        help="Output directory (default: next to --model)")
+    parser.add_argument("--calibrate", type=str, default=None,
+                        help="Session directory whose rgb/ frames calibrate int8-static")
+    parser.add_argument("--limit", type=int, default=200,
+                        help="Max calibration frames (default: 200)")
+    args = parser.parse_args()
+
+    model = Path(args.model)
+    out_dir = Path(args.out_dir) if args.out_dir else model.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+    output = out_dir / f"{model.stem}-{args.variant}.onnx"
+    quantize(args.variant, model, output,
+             Path(args.calibrate) if args.calibrate else None, args.limit)
+    print(f"Wrote {output} ({output.stat().st_size / 1e6:.1f} MB, "
+          f"FP32 {model.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Re-run YOLO over every frame of a recorded session.
+
+Live sessions only log detections for the frames the control loop saw
+(about 1 fps), with whatever model and thresholds were current. This
+tool runs the current model over every rgb/ frame (loose or packed) and writes a dense
+yolo/redetections.jsonl in the detections.jsonl format, which
+compose_video.py --redetections renders instead of the live log.
+
+JPEG decoding runs in a thread pool one batch ahead of inference, and
+frames are inferred in batches with the same letterbox_blob /
+wrap_detection code as yolo_server. Interrupted runs resume where they
+stopped (frames already in the output are skipped).
+
+Usage:
+    python3.6 redetect_session.py sessions/20260405_115449
+    python3 redetect_session.py sessions/20260405_115449 --engine onnxruntime --batch-size 8
+    python3 redetect_session.py sessions/20260405_115449 --overwrite --targets-only
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import frame_pack
+import yolo_server
+
+
+def load_targets():
+    """targets.yaml entries (name, priority, confidence), or [] if missing."""
+    if not os.path.exists(yolo_server.TARGETS_PATH):
+        return []
+    import yaml
+    with open(yolo_server.TARGETS_PATH) as f:
+        return yaml.safe_load(f).get('targets', [])
+
+
+def select_target(detections, targets):
+    """Same rule as body_follow.select_target: best confidence in the top-priority group."""
+    target_map = {t['name']: t for t in targets}
+    valid = [d for d in detections
+             if d['label'] in target_map and d['confidence'] >= target_map[d['label']]['confidence']]
+    if not valid:
+        return None
+    best_priority = min(target_map[d['label']]['priority'] for d in valid)
+    group = [d for d in valid if target_map[d['label']]['priority'] == best_priority]
+    return max(group, key=lambda d: d['confidence'])
+
+
+def done_frames(output: Path):
+    """Frame names already in the output file (resume support)."""
+    done = set()
+    if not output.exists():
+        return done
+    with open(str(output)) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['frame'])
+            except (ValueError, KeyError):
+                continue  # torn last line from an interrupted run
+    return done
+
+
+def decode(source):
+    data = np.frombuffer(frame_pack.read_bytes(source), np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def detect_batch(engine, images, allowed_classes):
+    """Detections per image, through the yolo_server pre/post-processing."""
+    blob, factors = yolo_server.letterbox_blob(images)
+    outputs = yolo_server.infer_blob(blob, engine)
+    return [yolo_server.build_detections(*yolo_server.wrap_detection(output, f, allowed_classes))
+            for output, f in zip(outputs, factors)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run YOLO over all frames of a session")
+    parser.add_argument("session", type=str, help="Session directory with rgb/ frames")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Output JSONL (default: <session>/yolo/redetections.jsonl)")
+    parser.add_argument("--engine", choices=["opencv", "onnxruntime"], default="opencv",
+                        help="Inference backend (default: opencv)")
+    parser.add_argument("--device", choices=["cuda", "cpu"], default="cuda",
+                        help="OpenCV DNN target (default: cuda)")
+    parser.add_argument("--model", type=str, default=yolo_server.MODEL_PATH)
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decode-workers", type=int, default=4,
+                        help="Threads decoding JPEGs ahead of inference (default: 4)")
+    parser.add_argument("--targets-only", action="store_true",
+                        help="Keep only targets.yaml classes")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Start over instead of resuming (e.g. after a model change)")
+    args = parser.parse_args()
+
+    session = Path(args.session)
+    # (file name, source); names as in detections.jsonl "frame"
+    frames = [(f"{ts}.jpg", source) for ts, source in frame_pack.list_frames(session / "rgb", ".jpg")]
+    if not frames:
+        sys.exit(f"No frames in {session}/rgb")
+    output = Path(args.output) if args.output else session / "yolo" / "redetections.jsonl"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if args.overwrite and output.exists():
+        output.unlink()
+    done = done_frames(output)
+    todo = [f for f in frames if f[0] not in done]
+    print(f"{len(frames)} frames, {len(done)} already done, {len(todo)} to process -> {output}")
+    if not todo:
+        return
+
+    options = dict(yolo_server.engine_options, engine=args.engine, device=args.device,
+                   model=args.model, intra_op_threads=args.intra_op_threads)
+    engine = yolo_server.build_engine(options)
+    yolo_server.class_list = yolo_server.load_classes()
+    targets = load_targets()
+    allowed = None
+    if args.targets_only:
+        allowed = yolo_server.class_filter_from_labels([t['name'] for t in targets])
+
+    batches = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    # Finish a torn last line so appended entries start on their own line
+    if output.exists() and output.stat().st_size:
+        with open(str(output), 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    start = time.time()
+    processed = 0
+    infer_time = 0.0
+    with ThreadPoolExecutor(args.decode_workers) as pool, open(str(output), 'a') as out:
+        if needs_newline:
+            out.write("\n")
+        pending = [pool.submit(decode, source) for _, source in batches[0]]
+        for index, batch in enumerate(batches):
+            images = [future.result() for future in pending]
+            # Decode the next batch while this one runs through the model
+            if index + 1 < len(batches):
+                pending = [pool.submit(decode, source) for _, source in batches[index + 1]]
+            names = [name for (name, _), img in zip(batch, images) if img is not None]
+            images = [img for img in images if img is not None]
+            if not images:
+                continue
+
+            t0 = time.time()
+            results = detect_batch(engine, images, allowed)
+            infer_time += time.time() - t0
+
+            for name, detections in zip(names, results):
+                selected = select_target(detections, targets)
+                out.write(json.dumps({
+                    "timestamp": name[:-len(".jpg")],
+                    "frame": name,
+                    "detections": detections,
+                    "target_label": selected['label'] if selected else None,
+                    "target_bbox": selected['bbox'] if selected else None,
+                    "target_confidence": selected['confidence'] if selected else None,
+                }) + "\n")
+            out.flush()
+            processed += len(images)
+
+            if (index + 1) % 10 == 0 or index + 1 == len(batches):
+                elapsed = time.time() - start
+                print(f"  {processed}/{len(todo)} frames  {processed / elapsed:.1f} FPS "
+                      f"(inference {processed / max(infer_time, 1e-9):.1f} FPS)")
+
+    elapsed = time.time() - start
+    print(f"Done: {processed} frames in {elapsed:.1f}s, {processed / elapsed:.1f} FPS")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 
+import frame_pack
+
 
 def parse_timestamp(ts: str) -> datetime:
     return datetime.strptime(ts, "%Y%m%d_%H%M%S_%f")
@@ -34,9 +36,15 @@ def load_detections(session_dir: str):
     return records
 
 
+def load_frame_times(session_dir: str):
+    """Capture times of the saved rgb/ frames (pack index or file names; no image reads)."""
+    return [parse_timestamp(ts) for ts, _ in frame_pack.list_frames(Path(session_dir) / "rgb", ".jpg")]
+
+
 def main():
     session_dir = sys.argv[1] if len(sys.argv) > 1 else "sessions/20260405_115449"
     records = load_detections(session_dir)
+    frame_times = load_frame_times(session_dir)
 
     # Collect per-label time series: {label: [(time, confidence), ...]}
     label_series = defaultdict(list)
@@ -111,6 +119,11 @@ def main():
         )
         ax2.step(times_s, numeric_states, where="post", color="#343a40", linewidth=0.8)
 
+    # Saved camera frames as a rug under the states: gaps = frames not recorded
+    if frame_times:
+        ax2.plot(frame_times, [-0.35] * len(frame_times), "|", color="#0d6efd",
+                 markersize=6, alpha=0.3)
+
     ax2.set_yticks(list(state_map.values()))
     ax2.set_yticklabels(state_labels, fontsize=9)
     ax2.set_ylim(-0.5, 3.5)
@@ -1,10 +1,22 @@
 import cv2
+import os
+import threading
 import time
 import sys
 import numpy as np
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import argparse
+import collections
 import logging
+import multiprocessing
+import queue
+import zlib
+
+# Binary response format shared with the clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+import detection_codec
+import frame_ring
 
 # Setup logging
 logging.basicConfig(
@@ -23,22 +35,169 @@ SCORE_THRESHOLD = 0.2
 NMS_THRESHOLD = 0.4
 CONFIDENCE_THRESHOLD = 0.4
 
-# Model and classes are loaded once on startup
-is_cuda = len(sys.argv) > 1 and sys.argv[1] == "cpu"  # Default to CUDA unless CPU is specified
-net = None
+# Inference pipeline: max requests waiting for the preprocess stage before 503
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_TIMEOUT = 10.0  # seconds a request waits for its result
+METRICS_WINDOW = 1000    # samples per stage kept for /metrics percentiles
+SIZE_EWMA_ALPHA = 0.2    # weight of the newest forward time in SizeController estimates
+SIZE_ESTIMATE_MAX_AGE = 10.0  # seconds a size's estimate is trusted without a new measurement
+RESULT_CACHE_SIZE = 64   # responses kept for repeated frames (0 disables the cache)
+MAX_BATCH_SIZE = 16      # images per /detect/batch request (blob: ~4.9 MB per image at 640)
+
+# POSIX shared memory segments (multiprocessing.shared_memory) live here on Linux
+SHM_DIR = "/dev/shm"
+
+MODEL_PATH = "config_files/yolov5s.onnx"
+# Backend-optimized models saved on first start and reused afterwards
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config_files", "cache")
+TARGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "targets.yaml")
+
+# Model and classes are loaded once on startup; options are set from the CLI in __main__
+engine_options = {
+    "engine": "opencv",      # opencv | onnxruntime
+    "device": "cuda",        # cuda | cpu (opencv engine only)
+    "model": MODEL_PATH,
+    "intra_op_threads": 0,   # 0 = runtime default (onnxruntime engine only)
+    "inter_op_threads": 0,
+    "size_models": {},       # extra input sizes: {320: "config_files/yolov5s-320.onnx"}
+    "dynamic_sizes": [],     # extra sizes served by the main model (dynamic-shape export)
+}
+default_latency_budget = None  # ms; picks the input size when a request names neither size nor budget
+engines = {}  # input size -> engine; INPUT_WIDTH is always present
+pipeline = None
+result_cache = None
 class_list = []
+default_class_filter = None  # class ids applied when a request gives no ?classes= (None = all)
+_batch_supported = True  # cleared if the model rejects batch > 1
 
-def build_model(is_cuda):
-    net = cv2.dnn.readNet("config_files/yolov5s.onnx")
-    if is_cuda:
-        logger.info("Running on CPU")
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-    else:
-        logger.info("Attempting to use CUDA")
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
-    return net
+# Per-thread preprocessing buffers (letterbox canvases + input blob), reused across requests
+_buffers = threading.local()
+_PIXEL_SCALE = np.float32(1 / 255.0)
+
+def _import_onnxruntime():
+    """Import onnxruntime on first use; it is slow to import and the OpenCV engine never needs it."""
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError("onnxruntime engine requested but onnxruntime is not installed")
+    return onnxruntime
+
+def cached_model_path(model_path, tag):
+    """Cache file for an optimized copy of model_path; changes when the model file does."""
+    st = os.stat(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}-{st.st_size:x}-{int(st.st_mtime):x}-{tag}.onnx")
+
+class InferenceEngine:
+    """Runs the YOLO network on a preprocessed NCHW float32 blob."""
+
+    name = "base"
+    input_size = INPUT_WIDTH  # square network input side the model was exported for
+
+    def infer(self, blob):
+        """Return raw network output of shape (N, rows, 85) for an (N, 3, H, W) blob."""
+        raise NotImplementedError
+
+
+class OpenCVEngine(InferenceEngine):
+    """OpenCV DNN backend: CUDA FP16 on the Jetson, or the OpenCV CPU path."""
+
+    name = "opencv"
+
+    def __init__(self, model_path, use_cuda=True):
+        self.net = cv2.dnn.readNet(model_path)
+        if use_cuda:
+            logger.info("Attempting to use CUDA")
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+        else:
+            logger.info("Running on CPU")
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def infer(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+class OnnxRuntimeEngine(InferenceEngine):
+    """ONNX Runtime backend on the CPU execution provider."""
+
+    name = "onnxruntime"
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        ort = _import_onnxruntime()
+        # The portable graph rewrites (constant folding, fusions) run once and
+        # are cached. Layout optimizations (NCHWc) depend on the CPU they were
+        # made for, so they are never serialized and run at every load:
+        # config_files (and the cache in it) gets copied between machines.
+        cached = cached_model_path(model_path, f"ort{ort.__version__}-extended")
+        if os.path.exists(cached):
+            logger.info(f"Using cached optimized model {cached}")
+            model_path = cached
+        else:
+            try:
+                os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+                # Per-process temp name: pool workers may optimize concurrently
+                pending = f"{cached}.{os.getpid()}.tmp"
+                extended = ort.SessionOptions()
+                extended.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+                extended.optimized_model_filepath = pending
+                ort.InferenceSession(model_path, sess_options=extended,
+                                     providers=["CPUExecutionProvider"])
+                os.replace(pending, cached)
+                logger.info(f"Saved optimized model to {cached}")
+                model_path = cached
+            except OSError as e:
+                logger.warning(f"Optimized model cache disabled: {e}")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            # Inter-op threads are only used when independent graph nodes run in parallel
+            opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(model_path, sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # FP16 exports without keep_io_types take and return float16 tensors;
+        # INT8 (QDQ or dynamic) models keep float32 I/O
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        logger.info(f"Running on ONNX Runtime CPU (intra_op={intra_op_threads or 'auto'}, "
+                    f"inter_op={inter_op_threads or 'auto'}, input={model_input.type})")
+
+    def infer(self, blob):
+        if blob.dtype != self.input_dtype:
+            blob = blob.astype(self.input_dtype)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        return output if output.dtype == np.float32 else output.astype(np.float32)
+
+
+def build_engines(options):
+    """Engines for every configured input size: {size: engine}."""
+    result = {INPUT_WIDTH: build_engine(options)}
+    for size in options["dynamic_sizes"]:
+        result[size] = result[INPUT_WIDTH]
+    for size, model_path in sorted(options["size_models"].items()):
+        result[size] = build_engine(dict(options, model=model_path))
+        result[size].input_size = size
+        logger.info(f"Loaded {size}x{size} model variant: {model_path}")
+    return result
+
+def resolve_input_size(requested, available):
+    """Requested network input size if loaded, else the default INPUT_WIDTH."""
+    return requested if requested in available else INPUT_WIDTH
+
+def build_engine(options):
+    """Create the inference engine selected by `options` (see engine_options)."""
+    if options["engine"] == "onnxruntime":
+        return OnnxRuntimeEngine(options["model"],
+                                 intra_op_threads=options["intra_op_threads"],
+                                 inter_op_threads=options["inter_op_threads"])
+    if options["engine"] == "opencv":
+        return OpenCVEngine(options["model"], use_cuda=options["device"] == "cuda")
+    raise ValueError(f"Unknown engine: {options['engine']}")
 
 def load_classes():
     classes = []
@@ -46,93 +205,908 @@ def load_classes():
         classes = [cname.strip() for cname in f.readlines()]
     return classes
 
-def detect(image, net):
-    blob = cv2.dnn.blobFromImage(image, 1/255.0, (INPUT_WIDTH, INPUT_HEIGHT), swapRB=True, crop=False)
-    net.setInput(blob)
-    preds = net.forward()
+def load_target_labels(path=TARGETS_PATH):
+    """Label names listed in targets.yaml."""
+    import yaml
+    with open(path) as f:
+        cfg = yaml.safe_load(f)
+    return [t['name'] for t in cfg.get('targets', [])]
+
+def class_filter_from_labels(labels):
+    """Map label names to an array of class ids; None for an empty list or 'all'."""
+    labels = [l.strip() for l in labels if l.strip()]
+    if not labels or labels == ['all']:
+        return None
+    unknown = [l for l in labels if l not in class_list]
+    if unknown:
+        raise RequestError(f"Unknown class labels: {', '.join(unknown)}")
+    return np.array([class_list.index(l) for l in labels], dtype=np.int64)
+
+def _blob(shape, slot):
+    """Reusable float32 blob of `shape` for this thread and slot (replaced on a shape change)."""
+    blobs = getattr(_buffers, 'blobs', None)
+    if blobs is None:
+        blobs = _buffers.blobs = {}
+    blob = blobs.get(slot)
+    if blob is None or blob.shape != shape:
+        blob = blobs[slot] = None  # drop the old one before allocating
+        blob = blobs[slot] = np.empty(shape, np.float32)
+    return blob
+
+def _pack_canvas(canvas, out):
+    # HWC BGR -> CHW RGB view, scaled straight into the blob
+    np.multiply(canvas.transpose(2, 0, 1)[::-1], _PIXEL_SCALE, out=out)
+
+def make_blob(images, slot=0):
+    """Pack letterboxed BGR canvases into a reusable NCHW float blob.
+
+    Equivalent to blobFromImages(images, 1/255, swapRB=True) for canvases that
+    are already network-sized, but without a new allocation per call. Blobs are
+    per thread and per `slot`, so a producer can keep several in flight.
+    """
+    height, width = images[0].shape[:2]
+    blob = _blob((len(images), 3, height, width), slot)
+    for i, image in enumerate(images):
+        _pack_canvas(image, blob[i])
+    return blob
+
+def letterbox_blob(images, size=INPUT_WIDTH, slot=0, timings=None):
+    """Letterbox frames straight into a reusable (N, 3, size, size) blob.
+
+    Each frame goes through the same canvas and is packed into the blob
+    before the next one is letterboxed, so a batch costs one canvas however
+    many images it has. Returns (blob, factors); adds "letterbox" and
+    "blob" milliseconds to `timings` if given.
+    """
+    blob = _blob((len(images), 3, size, size), slot)
+    factors = []
+    letterbox_s = pack_s = 0.0
+    for i, image in enumerate(images):
+        t0 = time.perf_counter()
+        canvas, f = format_yolov5(image, size=size)
+        t1 = time.perf_counter()
+        _pack_canvas(canvas, blob[i])
+        pack_s += time.perf_counter() - t1
+        letterbox_s += t1 - t0
+        factors.append(f)
+    if timings is not None:
+        timings["letterbox"] = letterbox_s * 1000
+        timings["blob"] = pack_s * 1000
+    return blob, factors
+
+def detect(image, engine):
+    preds = engine.infer(make_blob([image]))
     return preds
 
-def format_yolov5(frame):
-    row, col, _ = frame.shape
-    _max = max(col, row)
-    result = np.zeros((_max, _max, 3), np.uint8)
-    result[0:row, 0:col] = frame
-    return result
+def infer_blob(blob, engine):
+    """Forward an (N, 3, H, W) blob, returning (N, rows, 85).
+
+    Models exported with a fixed batch of 1 reject larger blobs; in that case
+    fall back to one forward per image.
+    """
+    global _batch_supported
+    if len(blob) == 1:
+        return engine.infer(blob)
+    if _batch_supported:
+        try:
+            preds = engine.infer(blob)
+            if preds.shape[0] == len(blob):
+                return preds
+        except Exception as e:
+            logger.warning(f"Batched forward failed ({e}), falling back to per-image inference")
+        _batch_supported = False
+    return np.concatenate([engine.infer(blob[i:i + 1]) for i in range(len(blob))], axis=0)
+
+def detect_batch(images, engine):
+    """Run one forward pass over several letterboxed images (one NCHW blob)."""
+    return infer_blob(make_blob(images), engine)
+
+def _canvas(slot, size):
+    """Reusable size x size canvas for this thread (one per slot and size; letterbox_blob uses slot 0)."""
+    canvases = getattr(_buffers, 'canvases', None)
+    if canvases is None:
+        canvases = _buffers.canvases = {}
+    canvas = canvases.get((slot, size))
+    if canvas is None:
+        canvas = canvases[(slot, size)] = np.zeros((size, size, 3), np.uint8)
+    return canvas
+
+def format_yolov5(frame, slot=0, size=INPUT_WIDTH):
+    """Letterbox a frame into a reusable network-sized (size x size) canvas.
 
-def wrap_detection(input_image, output_data):
-    class_ids = []
-    confidences = []
-    boxes = []
+    The frame is resized (aspect preserved) straight into the top-left of the
+    canvas; the rest stays black. Returns (canvas, (x_factor, y_factor)), the
+    per-axis factors mapping network coordinates back to frame pixels. The
+    canvas is overwritten by the next call on the same thread and slot.
+    """
+    row, col = frame.shape[:2]
+    scale = min(size / col, size / row)
+    new_w = max(1, min(size, int(round(col * scale))))
+    new_h = max(1, min(size, int(round(row * scale))))
 
-    rows = output_data.shape[0]
+    canvas = _canvas(slot, size)
+    region = canvas[:new_h, :new_w]
+    resized = cv2.resize(frame, (new_w, new_h), dst=region, interpolation=cv2.INTER_LINEAR)
+    if not np.shares_memory(resized, canvas):
+        # Older OpenCV builds do not write into non-contiguous views
+        region[...] = resized
+    canvas[new_h:, :] = 0
+    canvas[:new_h, new_w:] = 0
 
-    image_width, image_height, _ = input_image.shape
+    return canvas, (col / new_w, row / new_h)
 
-    x_factor = image_width / INPUT_WIDTH
-    y_factor = image_height / INPUT_HEIGHT
+def wrap_detection(output_data, factors, allowed_classes=None):
+    """Decode a YOLOv5 output tensor of shape (N, 85) into NMS-filtered boxes.
 
-    for r in range(rows):
-        row = output_data[r]
-        confidence = row[4]
-        if confidence >= CONFIDENCE_THRESHOLD:
-            classes_scores = row[5:]
-            _, _, _, max_indx = cv2.minMaxLoc(classes_scores)
-            class_id = max_indx[1]
-            if (classes_scores[class_id] > SCORE_THRESHOLD):
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
+    Fully vectorized: rows are filtered on objectness, classes picked with
+    argmax and boxes converted/scaled as array operations. `factors` is the
+    (x_factor, y_factor) pair returned by format_yolov5. If `allowed_classes`
+    (array of class ids) is given, rows whose best class is not in it are
+    dropped before box conversion and NMS.
+    """
+    class_ids, confidences, boxes = decode_predictions(output_data, factors, allowed_classes)
+    return nms_select(class_ids, confidences, boxes)
 
-                x, y, w, h = row[0].item(), row[1].item(), row[2].item(), row[3].item() 
-                left = int((x - 0.5 * w) * x_factor)
-                top = int((y - 0.5 * h) * y_factor)
-                width = int(w * x_factor)
-                height = int(h * y_factor)
-                box = [left, top, width, height]
-                boxes.append(box)
+def decode_predictions(output_data, factors, allowed_classes=None):
+    """Candidate (class_ids, confidences, boxes) arrays before NMS; see wrap_detection."""
+    x_factor, y_factor = factors
 
-    confidences = np.array(confidences).astype(np.float32)
+    # Objectness filter
+    candidates = output_data[output_data[:, 4] >= CONFIDENCE_THRESHOLD]
 
+    # Best class per surviving row
+    classes_scores = candidates[:, 5:]
+    class_ids = np.argmax(classes_scores, axis=1)
+    best_scores = classes_scores[np.arange(len(class_ids)), class_ids]
+    keep = best_scores > SCORE_THRESHOLD
+    if allowed_classes is not None:
+        keep &= np.isin(class_ids, allowed_classes)
+    candidates = candidates[keep]
+    class_ids = class_ids[keep]
+
+    confidences = candidates[:, 4].astype(np.float32)
+
+    # cx, cy, w, h (network space) -> left, top, width, height (image space).
+    # float64 like the scalar reference, else int truncation can be off by a pixel
+    x, y, w, h = candidates[:, :4].astype(np.float64).T
+    boxes = np.stack([
+        (x - 0.5 * w) * x_factor,
+        (y - 0.5 * h) * y_factor,
+        w * x_factor,
+        h * y_factor,
+    ], axis=1).astype(np.int32)
+
+    return class_ids, confidences, boxes
+
+def batched_nms(class_ids, confidences, boxes):
+    """Class-aware NMS: a box only suppresses boxes of its own class.
+
+    Each class is shifted into its own coordinate range, so a single
+    NMSBoxes call never compares boxes across classes. Same result and
+    speed as cv2.dnn.NMSBoxesBatched, which needs OpenCV >= 4.6 (see
+    bench_postprocess.py). Returns kept indices, best first.
+    """
+    span = int((boxes[:, :2] + boxes[:, 2:]).max() - boxes[:, :2].min()) + 1
+    shifted = boxes.copy()
+    shifted[:, :2] += (class_ids.astype(np.int32) * span)[:, None]
+    indexes = cv2.dnn.NMSBoxes(shifted.tolist(), confidences.tolist(),
+                               CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+    return np.array(indexes, dtype=np.int64).reshape(-1)
+
+def nms_select(class_ids, confidences, boxes):
+    """Run class-aware NMS over decoded candidates and return plain lists for the response."""
     if len(boxes) > 0:
-        indexes = cv2.dnn.NMSBoxes(boxes, confidences, CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+        indexes = batched_nms(class_ids, confidences, boxes)
     else:
-        indexes = []
+        indexes = np.empty(0, dtype=np.int64)
 
-    result_class_ids = []
-    result_confidences = []
-    result_boxes = []
-
-    for i in indexes:
-        idx = i if isinstance(i, int) else i[0]
-        result_confidences.append(confidences[idx])
-        result_class_ids.append(class_ids[idx])
-        result_boxes.append(boxes[idx])
+    result_class_ids = class_ids[indexes].tolist()
+    result_confidences = confidences[indexes].tolist()
+    result_boxes = boxes[indexes].tolist()
 
     return result_class_ids, result_confidences, result_boxes
 
-# Initialize model on startup
-@app.before_first_request
-def startup_event():
-    global net, class_list
+def build_detections(class_ids, confidences, boxes):
+    """Format decoder output as the JSON-ready list returned by /detect/."""
+    detections = []
+    for class_id, confidence, box in zip(class_ids, confidences, boxes):
+        detections.append({
+            "label": class_list[class_id],
+            "confidence": float(confidence),
+            "bbox": box  # [x, y, width, height]
+        })
+    return detections
+
+class StageMetrics:
+    """Rolling per-stage latency samples and request rate for /metrics."""
+
+    def __init__(self, window=METRICS_WINDOW, rate_window=60.0):
+        self.window = window
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._completions = collections.deque()
+        self.requests_total = 0
+        self.errors_total = 0
+
+    def record(self, timings):
+        now = time.time()
+        with self._lock:
+            for stage, ms in timings.items():
+                samples = self._samples.get(stage)
+                if samples is None:
+                    samples = self._samples[stage] = collections.deque(maxlen=self.window)
+                samples.append(ms)
+            self.requests_total += 1
+            self._completions.append(now)
+            while self._completions and self._completions[0] < now - self.rate_window:
+                self._completions.popleft()
+
+    def record_error(self):
+        with self._lock:
+            self.errors_total += 1
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            samples = {stage: np.array(s) for stage, s in self._samples.items()}
+            recent = sum(1 for t in self._completions if t >= now - self.rate_window)
+            totals = (self.requests_total, self.errors_total)
+        stages = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stages[stage] = {
+                "count": int(len(values)),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+            }
+        return {
+            "requests_total": totals[0],
+            "errors_total": totals[1],
+            "request_rate": round(recent / self.rate_window, 2),
+            "stages": stages,
+        }
+
+
+class SizeController:
+    """Picks a network input size that fits a latency budget.
+
+    Tracks an EWMA of the forward time per input size. Sizes not measured
+    recently (max_age seconds) are estimated from a recently measured one,
+    scaled by input area: a size only runs when it is expected to fit, so a
+    slow spike recorded for 640 would otherwise keep it out for good.
+    """
+
+    def __init__(self, sizes, alpha=SIZE_EWMA_ALPHA, max_age=SIZE_ESTIMATE_MAX_AGE):
+        self.sizes = sorted(sizes)
+        self.alpha = alpha
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._forward_ms = {}  # size -> (EWMA ms, time.monotonic() of the last measurement)
+
+    def record(self, size, forward_ms):
+        now = time.monotonic()
+        with self._lock:
+            prev = self._forward_ms.get(size)
+            if prev is not None and now - prev[1] <= self.max_age:
+                forward_ms = prev[0] + self.alpha * (forward_ms - prev[0])
+            self._forward_ms[size] = (forward_ms, now)
+
+    def estimate(self, size):
+        """Expected forward time (ms) at `size`, or None with no measurements."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._forward_ms.get(size)
+            if entry is not None and now - entry[1] <= self.max_age:
+                return entry[0]
+            fresh = {s: ms for s, (ms, t) in self._forward_ms.items() if now - t <= self.max_age}
+            if not fresh:
+                # Idle server: old measurements are all there is
+                if entry is not None:
+                    return entry[0]
+                fresh = {s: ms for s, (ms, _) in self._forward_ms.items()}
+            if not fresh:
+                return None
+            known, ms = max(fresh.items())
+        return ms * (size / known) ** 2
+
+    def choose(self, budget_ms):
+        """Largest size expected to fit budget_ms; the smallest if none does."""
+        for size in reversed(self.sizes):
+            expected = self.estimate(size)
+            if expected is None:
+                return INPUT_WIDTH if INPUT_WIDTH in self.sizes else size
+            if expected <= budget_ms:
+                return size
+        return self.sizes[0]
+
+    def snapshot(self):
+        with self._lock:
+            return {str(size): round(ms, 3) for size, (ms, _) in sorted(self._forward_ms.items())}
+
+
+class ResultCache:
+    """LRU of finished responses keyed by frame identity plus request parameters."""
+
+    def __init__(self, capacity=RESULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def frame_identity(source, frame_id=None):
+    """Cache identity of a frame source, or None when it cannot be cached.
+
+    A caller-supplied frame id wins; otherwise uploaded bytes are hashed with
+    CRC-32 plus length (~0.3 ms for an 848x480 raw frame). Shared-memory
+    frames are rewritten in place, so they need a frame id.
+    """
+    if frame_id:
+        return ("id", frame_id)
+    kind = source[0]
+    if kind == "jpeg":
+        return ("jpeg",) + tuple((len(data), zlib.crc32(data)) for _, data in source[1])
+    if kind == "raw":
+        _, data, width, height = source
+        return ("raw", width, height, zlib.crc32(data))
+    return None
+
+
+class RequestError(ValueError):
+    """Invalid request parameter, header or body field (reported to the client as 400)."""
+
+
+class FrameError(RequestError):
+    """Uploaded frame could not be decoded (reported to the client as 400)."""
+
+
+class RingUnavailable(FrameError):
+    """The requested frame ring cannot be mapped on this host (404); send frames over HTTP."""
+
+
+PRIORITY_REALTIME = "realtime"
+PRIORITY_BULK = "bulk"
+
+def job_params(batch=False, class_filter=None, input_size=INPUT_WIDTH, roi=None,
+               priority=PRIORITY_BULK, client=None):
+    """Per-request inference parameters (picklable, sent to pool workers as-is).
+
+    batch:        respond with per-image "results" instead of "detections"
+    class_filter: array of allowed class ids, or None for all classes
+    input_size:   network input side; must be one of the loaded engine sizes
+    roi:          [x, y, w, h] region of the frame to run on, or None for the
+                  full frame; boxes are mapped back to full-frame coordinates
+    priority:     "realtime" (control loop) jobs are admitted before "bulk" ones
+    client:       caller identity; a newer realtime frame from the same client
+                  supersedes its queued older one
+    """
+    return {"batch": batch, "class_filter": class_filter, "input_size": input_size, "roi": roi,
+            "priority": priority, "client": client}
+
+
+class Superseded(Exception):
+    """A queued realtime frame was replaced by a newer one from the same client (409)."""
+
+
+class WorkerUnavailable(Exception):
+    """The pool worker running a job died, or none is left to take it (503)."""
+
+
+class AdmissionQueue:
+    """Queue in front of the pipeline: realtime jobs first, bulk jobs after.
+
+    Drop-in for the queue.Queue it replaces (put_nowait/get/qsize). Each
+    lane holds up to maxsize jobs, so bulk load never causes a realtime 503.
+    A realtime job evicts queued realtime jobs from the same client, which
+    fail with Superseded; only the newest frame is worth computing.
+    """
+
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._lanes = {PRIORITY_REALTIME: collections.deque(), PRIORITY_BULK: collections.deque()}
+        self._ready = threading.Condition()
+        self.superseded = 0
+
+    def put_nowait(self, job):
+        realtime = job.params["priority"] == PRIORITY_REALTIME
+        lane = self._lanes[PRIORITY_REALTIME if realtime else PRIORITY_BULK]
+        stale = []
+        with self._ready:
+            if realtime and job.params["client"] is not None:
+                stale = [j for j in lane if j.params["client"] == job.params["client"]]
+                for old in stale:
+                    lane.remove(old)
+                self.superseded += len(stale)
+            if len(lane) >= self.maxsize:
+                raise queue.Full
+            lane.append(job)
+            self._ready.notify()
+        for old in stale:
+            old.error = Superseded("Superseded by a newer frame from the same client")
+            old.done.set()
+
+    def get(self):
+        with self._ready:
+            while True:
+                for lane in self._lanes.values():  # realtime lane first
+                    if lane:
+                        return lane.popleft()
+                self._ready.wait()
+
+    def qsize(self):
+        with self._ready:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def depth(self):
+        with self._ready:
+            return {f"requests_{name}": len(lane) for name, lane in self._lanes.items()}
+
+
+class _Job:
+    """One /detect request travelling through the inference pipeline."""
+
+    def __init__(self, source, params):
+        self.source = source    # frame source tuple, see load_frames()
+        self.params = params    # see job_params()
+        self.offset = (0, 0)    # ROI origin added back to boxes
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.submitted = time.perf_counter()
+        self.started = None     # preprocessing start (after decode), for processing_time
+        self.handoff = None     # when the job was queued for the next stage
+        self.timings = {}       # stage -> milliseconds
+
+
+def preprocess_job(job, slot=0):
+    """Decode + letterbox + blob stage. Returns (blob, factors)."""
+    t = job.timings
+    t0 = time.perf_counter()
+    t["queue"] = (t0 - job.submitted) * 1000
+    images = load_frames(job.source)
+    roi = job.params["roi"]
+    if roi is not None:
+        images, job.offset = crop_roi(images, roi)
+    t1 = time.perf_counter()
+    t["decode"] = (t1 - t0) * 1000
+    blob, factors = letterbox_blob(images, job.params["input_size"], slot, t)
+    job.started = t1
+    job.handoff = time.perf_counter()
+    return blob, factors
+
+def crop_roi(images, roi):
+    """Crop frames to roi [x, y, w, h] (clamped to the frame); returns (views, (x, y))."""
+    height, width = images[0].shape[:2]
+    x, y, w, h = roi
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(width, x + w), min(height, y + h)
+    if x2 <= x1 or y2 <= y1:
+        raise RequestError(f"ROI {roi} lies outside the {width}x{height} frame")
+    return [img[y1:y2, x1:x2] for img in images], (x1, y1)
+
+def forward_job(job, blob, engine):
+    """Forward stage. Returns raw (N, rows, 85) outputs."""
+    t0 = time.perf_counter()
+    outputs = infer_blob(blob, engine)
+    t1 = time.perf_counter()
+    job.timings["forward_wait"] = (t0 - job.handoff) * 1000
+    job.timings["forward"] = (t1 - t0) * 1000
+    job.handoff = t1
+    return outputs
+
+def postprocess_job(job, outputs, factors):
+    """Decode/NMS stage. Fills job.result with the response dict."""
+    global request_counter
+    t = job.timings
+    t["postprocess_wait"] = (time.perf_counter() - job.handoff) * 1000
+    request_counter += 1
+    results = []
+    decode_ms = nms_ms = 0.0
+    for output_data, f in zip(outputs, factors):
+        t0 = time.perf_counter()
+        class_ids, confidences, boxes = decode_predictions(output_data, f, job.params["class_filter"])
+        boxes[:, 0] += job.offset[0]
+        boxes[:, 1] += job.offset[1]
+        t1 = time.perf_counter()
+        class_ids, confidences, boxes = nms_select(class_ids, confidences, boxes)
+        t2 = time.perf_counter()
+        decode_ms += (t1 - t0) * 1000
+        nms_ms += (t2 - t1) * 1000
+        results.append({"detections": build_detections(class_ids, confidences, boxes)})
+    t["postprocess"] = decode_ms
+    t["nms"] = nms_ms
+    process_time = time.perf_counter() - job.started
+    t["total"] = (time.perf_counter() - job.submitted) * 1000
+    if job.params["batch"]:
+        logger.info(f"[{request_counter}] Batch of {len(results)} completed in {process_time:.3f} seconds")
+        job.result = {"results": results, "processing_time": process_time}
+    else:
+        detections = results[0]["detections"]
+        logger.info(f"[{request_counter}] Detection completed in {process_time:.3f} seconds, "
+                    f"found {len(detections)} objects")
+        job.result = {"detections": detections, "processing_time": process_time}
+    job.result["input_size"] = job.params["input_size"]
+    if job.params["roi"] is not None:
+        job.result["roi"] = list(job.params["roi"])
+
+
+class InferencePipeline:
+    """Dedicated inference worker that owns the engine.
+
+    Three threads connected by bounded queues, fed by an AdmissionQueue that
+    hands realtime jobs to preprocess before bulk ones:
+      preprocess  — decode + letterbox + blob for frame N+1
+      forward     — engine.infer for frame N (the only thread touching the engine)
+      postprocess — decode/NMS + response building for frame N-1
+    so steady-state throughput is bound by the forward pass rather than the
+    sum of all stages. Request threads only enqueue and wait. A realtime job
+    waits behind at most the three bulk jobs already past admission: one in
+    forward, one queued for it, and one preprocessed blob the preprocess
+    thread holds while blocked on the full forward queue.
+
+    That wait is about three forward passes, longer than camera_server's
+    frame ring keeps a frame, so /detect/shm copies ring frames in the
+    request thread and jobs always carry their own pixels; a frame that is
+    gone by then is a 400 before admission, never a failed job.
+    """
+
+    # Blobs in flight: one in forward, one queued for forward, one being filled
+    BLOB_SLOTS = 3
+
+    def __init__(self, engines, queue_size=PIPELINE_QUEUE_SIZE):
+        self.engines = engines
+        self.input_sizes = sorted(engines)
+        self.sizer = SizeController(self.input_sizes)
+        self.metrics = StageMetrics()
+        self._requests = AdmissionQueue(maxsize=queue_size)
+        self._forward_queue = queue.Queue(maxsize=1)
+        self._post_queue = queue.Queue(maxsize=1)
+        for target in (self._preprocess_loop, self._forward_loop, self._postprocess_loop):
+            threading.Thread(target=target, daemon=True).start()
+
+    def submit(self, source, params=None, timeout=PIPELINE_TIMEOUT):
+        """Run a job to completion and return (response dict, stage timings).
+
+        Raises queue.Full if the pipeline is saturated, RequestError for bad
+        input, Superseded if a newer realtime frame from the same client
+        replaced it, TimeoutError if no result arrives in time.
+        """
+        job = _Job(source, params or job_params())
+        self._requests.put_nowait(job)
+        if not job.done.wait(timeout):
+            raise TimeoutError("Inference timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result, job.timings
+
+    def queue_depth(self):
+        depth = self._requests.depth()
+        depth.update(forward=self._forward_queue.qsize(), postprocess=self._post_queue.qsize())
+        return depth
+
+    def superseded_total(self):
+        return self._requests.superseded
+
+    def _fail(self, job, error):
+        job.error = error
+        self.metrics.record_error()
+        job.done.set()
+
+    def _preprocess_loop(self):
+        slot = 0
+        while True:
+            job = self._requests.get()
+            try:
+                blob, factors = preprocess_job(job, slot)
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            slot = (slot + 1) % self.BLOB_SLOTS
+            self._forward_queue.put((job, blob, factors))
+
+    def _forward_loop(self):
+        while True:
+            job, blob, factors = self._forward_queue.get()
+            try:
+                outputs = forward_job(job, blob, self.engines[job.params["input_size"]])
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            self._post_queue.put((job, outputs, factors))
+
+    def _postprocess_loop(self):
+        while True:
+            job, outputs, factors = self._post_queue.get()
+            try:
+                postprocess_job(job, outputs, factors)
+                job.result["timings"] = {stage: round(ms, 3) for stage, ms in job.timings.items()}
+                self.metrics.record(job.timings)
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            job.done.set()
+
+
+def usable_cpus():
+    """Sorted CPU ids this process may run on (the whole machine where affinity is unsupported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _pool_worker(index, conn, options, cpus):
+    """Worker process for WorkerPool: own engines, pinned threads, serial jobs."""
+    global engines, class_list
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    cv2.setNumThreads(options["intra_op_threads"])
+    engines = build_engines(options)
+    class_list = load_classes()
+    warmup_engines(engines)
+    logger.info(f"Pool worker {index} ready (pid {os.getpid()}, cpus {sorted(cpus) if cpus else 'any'})")
+    conn.send(("ready", index))
+    while True:
+        try:
+            job_id, source, params = conn.recv()
+        except EOFError:
+            break
+        job = _Job(source, params)
+        try:
+            blob, factors = preprocess_job(job)
+            outputs = forward_job(job, blob, engines[params["input_size"]])
+            postprocess_job(job, outputs, factors)
+            conn.send((job_id, job.result, job.timings, None))
+        except Exception as e:
+            conn.send((job_id, None, job.timings, e))
+
+
+class WorkerPool:
+    """Multi-process serving for CPU machines.
+
+    Starts N worker processes, each with its own engine and a pinned number of
+    inference threads (and CPU cores where the OS allows). The Flask process
+    only dispatches: each request goes to the worker with the fewest jobs in
+    flight. Same submit()/queue_depth()/metrics interface as InferencePipeline.
+
+    With more than one worker, worker 0 is kept free of bulk jobs so realtime
+    requests never queue behind offline work. Jobs are handed to a worker
+    immediately, so there is no queue to supersede stale frames in.
+
+    A worker that exits is taken out of rotation; its jobs in flight fail
+    with WorkerUnavailable (503) instead of waiting for the timeout.
+    """
+
+    def __init__(self, options, workers, threads_per_worker, queue_size=PIPELINE_QUEUE_SIZE):
+        ctx = multiprocessing.get_context("spawn")
+        self.metrics = StageMetrics()
+        self.input_sizes = sorted(set([INPUT_WIDTH] + list(options["dynamic_sizes"])
+                                      + list(options["size_models"])))
+        self.sizer = SizeController(self.input_sizes)
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+        self._workers = []
+        worker_options = dict(options, intra_op_threads=threads_per_worker, inter_op_threads=1)
+        # Only the CPUs this process may run on (cpuset, taskset), not all of the machine's
+        allowed = usable_cpus()
+        for i in range(workers):
+            cpus = None
+            if workers * threads_per_worker <= len(allowed):
+                cpus = set(allowed[i * threads_per_worker:(i + 1) * threads_per_worker])
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_pool_worker, daemon=True,
+                                  args=(i, child_conn, worker_options, cpus))
+            process.start()
+            self._workers.append({
+                "index": i,
+                "conn": parent_conn,
+                "process": process,
+                "inflight": 0,
+                "jobs": set(),      # ids of this worker's jobs in flight
+                "alive": True,
+                "send_lock": threading.Lock(),
+            })
+        for worker in self._workers:
+            worker["conn"].recv()  # wait for the model to load
+            threading.Thread(target=self._reader_loop, args=(worker,), daemon=True).start()
+        logger.info(f"Worker pool: {workers} processes x {threads_per_worker} threads")
+
+    def submit(self, source, params=None, timeout=PIPELINE_TIMEOUT):
+        params = params or job_params()
+        job = _Job(source, params)
+        with self._lock:
+            candidates = [w for w in self._workers if w["alive"]]
+            if not candidates:
+                raise WorkerUnavailable("No inference worker running")
+            if params["priority"] != PRIORITY_REALTIME and len(self._workers) > 1:
+                # Bulk jobs go to worker 0 only once every other worker is gone
+                candidates = [w for w in candidates if w["index"] > 0] or candidates
+            worker = min(candidates, key=lambda w: w["inflight"])
+            if worker["inflight"] >= self.queue_size:
+                raise queue.Full
+            job_id = self._next_id
+            self._next_id += 1
+            self._pending[job_id] = job
+            worker["inflight"] += 1
+            worker["jobs"].add(job_id)
+        try:
+            with worker["send_lock"]:
+                worker["conn"].send((job_id, source, params))
+        except OSError:
+            self._worker_died(worker)  # fails this job too
+        if not job.done.wait(timeout):
+            with self._lock:
+                self._pending.pop(job_id, None)
+            raise TimeoutError("Inference timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result, job.timings
+
+    def queue_depth(self):
+        with self._lock:
+            # None marks a worker that has exited
+            return {f"worker_{w['index']}": w["inflight"] if w["alive"] else None
+                    for w in self._workers}
+
+    def superseded_total(self):
+        return 0
+
+    def _reader_loop(self, worker):
+        while True:
+            try:
+                job_id, result, timings, error = worker["conn"].recv()
+            except (EOFError, OSError):
+                self._worker_died(worker)
+                return
+            with self._lock:
+                worker["inflight"] -= 1
+                worker["jobs"].discard(job_id)
+                job = self._pending.pop(job_id, None)
+            if job is None:
+                continue  # caller timed out
+            if error is not None:
+                job.error = error
+                self.metrics.record_error()
+            else:
+                # Worker clocks are per process; measure end-to-end here
+                timings["ipc"] = max(0.0, (time.perf_counter() - job.submitted) * 1000 - timings["total"])
+                timings["total"] = (time.perf_counter() - job.submitted) * 1000
+                job.timings = timings
+                job.result = result
+                job.result["timings"] = {stage: round(ms, 3) for stage, ms in timings.items()}
+                self.metrics.record(timings)
+            job.done.set()
+
+    def _worker_died(self, worker):
+        """Stop routing to a worker that exited and fail its jobs in flight."""
+        with self._lock:
+            if not worker["alive"]:
+                return
+            worker["alive"] = False
+            jobs = [self._pending.pop(job_id, None) for job_id in worker["jobs"]]
+            worker["jobs"].clear()
+            worker["inflight"] = 0
+        worker["process"].join(1)
+        logger.error(f"Pool worker {worker['index']} exited "
+                     f"(exit code {worker['process'].exitcode}), {len(jobs)} jobs failed")
+        for job in jobs:
+            if job is None:
+                continue  # caller timed out
+            job.error = WorkerUnavailable(f"Pool worker {worker['index']} exited")
+            self.metrics.record_error()
+            job.done.set()
+
+
+def load_model(workers=0, threads_per_worker=0):
+    """Load engine, class list and start the inference pipeline.
+
+    With workers > 0 the engine lives in a WorkerPool of separate processes
+    instead of this one.
+    """
+    global engines, pipeline, class_list
     logger.info("Loading YOLO model...")
     start_time = time.time()
-    net = build_model(is_cuda)
     class_list = load_classes()
+    if workers > 0:
+        threads = threads_per_worker or max(1, len(usable_cpus()) // workers)
+        pipeline = WorkerPool(engine_options, workers, threads)
+    else:
+        engines = build_engines(engine_options)
+        pipeline = InferencePipeline(engines)
     logger.info(f"Model loaded in {time.time() - start_time:.2f} seconds")
 
-_warmed_up = False
+def warmup_engines(engines):
+    """One forward per engine and size: CUDA/cuDNN and ORT allocate lazily on the first run."""
+    for size, engine in engines.items():
+        engine.infer(make_blob([_canvas(0, size)]))
+
+def warmup():
+    """Push a dummy frame per input size through the whole pipeline."""
+    dummy = np.zeros((INPUT_HEIGHT, INPUT_WIDTH, 3), dtype=np.uint8)
+    for size in pipeline.input_sizes:
+        pipeline.submit(("array", [dummy]), job_params(input_size=size), timeout=None)
+
+# loading -> warming -> ready (or failed); reported by /ready
+startup_state = {"state": "loading", "since": time.time()}
+
+def set_startup_state(state):
+    elapsed = time.time() - startup_state["since"]
+    logger.info(f"Startup: {startup_state['state']} done in {elapsed:.2f}s, now {state}")
+    startup_state.update(state=state, since=time.time())
+
+def startup(workers=0, threads_per_worker=0, target_classes=False):
+    """Load the model and warm it up while the HTTP server is already answering /ready."""
+    global default_class_filter
+    boot = time.time()
+    try:
+        load_model(workers, threads_per_worker)
+        if target_classes:
+            labels = load_target_labels()
+            default_class_filter = class_filter_from_labels(labels)
+            logger.info(f"Default class filter from targets.yaml: {labels}")
+        set_startup_state("warming")
+        warmup()
+        set_startup_state("ready")
+        logger.info(f"YOLO ready {time.time() - boot:.2f}s after startup began")
+    except Exception:
+        logger.exception("YOLO startup failed")
+        set_startup_state("failed")
+        # Nothing to serve without a model; start.sh notices the exit right away
+        os._exit(1)
 
 @app.route('/ready', methods=['GET'])
 def ready_endpoint():
-    """Returns 200 once YOLO has completed a warmup inference."""
-    global _warmed_up, net
-    if not _warmed_up:
-        logger.info("Warmup inference starting...")
-        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-        start = time.time()
-        detect(dummy, net)
-        logger.info(f"Warmup inference done in {time.time() - start:.2f}s")
-        _warmed_up = True
-    return jsonify({"ready": True})
+    """200 once the model is loaded and warmed up; 503 with the current state until then."""
+    state = startup_state["state"]
+    body = {"ready": state == "ready", "state": state,
+            "state_elapsed": round(time.time() - startup_state["since"], 2)}
+    return jsonify(body), 200 if state == "ready" else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Rolling per-stage latency percentiles (ms), request rate (req/s) and queue depth."""
+    if pipeline is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    metrics = pipeline.metrics.snapshot()
+    metrics["queue_depth"] = pipeline.queue_depth()
+    metrics["superseded_total"] = pipeline.superseded_total()
+    metrics["input_sizes"] = pipeline.input_sizes
+    metrics["forward_ms_by_size"] = pipeline.sizer.snapshot()
+    if result_cache is not None:
+        metrics["cache"] = result_cache.snapshot()
+    return jsonify(metrics)
 
 @app.route('/test', methods=['GET'])
 def test_endpoint():
@@ -142,67 +1116,331 @@ def test_endpoint():
 def favicon():
     return "", 204
 
+def request_class_filter():
+    """Class allow-list for this request: ?classes=cat,dog, ?classes=all, or the server default."""
+    classes = request.args.get('classes')
+    if classes is None:
+        return default_class_filter
+    return class_filter_from_labels(classes.split(','))
+
+def server_timing_header(timings):
+    """Format stage timings (ms) as a Server-Timing header value."""
+    return ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in timings.items())
+
+def request_roi():
+    """?roi=x,y,w,h region of interest in frame pixels, or None for the full frame."""
+    roi = request.args.get('roi')
+    if not roi:
+        return None
+    try:
+        values = [int(float(v)) for v in roi.split(',')]
+    except ValueError:
+        values = []
+    if len(values) != 4 or values[2] <= 0 or values[3] <= 0:
+        raise RequestError("roi must be x,y,w,h with positive width and height")
+    return values
+
+def request_priority():
+    """X-Priority: realtime (the control loop) or bulk (default); X-Client-Id names the caller."""
+    priority = request.headers.get('X-Priority', PRIORITY_BULK).lower()
+    if priority not in (PRIORITY_REALTIME, PRIORITY_BULK):
+        raise RequestError("X-Priority must be realtime or bulk")
+    return {"priority": priority,
+            "client": request.headers.get('X-Client-Id') or request.remote_addr}
+
+def request_input_size():
+    """Network input size for this request.
+
+    ?size=N picks a loaded variant directly (default size if not loaded);
+    ?budget_ms=T (or the server's --latency-budget-ms) lets the
+    SizeController pick the largest size expected to forward within T.
+    """
+    try:
+        if 'size' in request.args:
+            return resolve_input_size(int(request.args['size']), pipeline.input_sizes)
+        budget = request.args.get('budget_ms', default_latency_budget)
+        if budget is not None:
+            return pipeline.sizer.choose(float(budget))
+    except ValueError:
+        raise RequestError("size and budget_ms must be numbers")
+    return INPUT_WIDTH
+
+def detection_response(result, batch):
+    """JSON response, or the compact binary format if the client accepts it (single frames)."""
+    if batch or not detection_codec.wants_binary(request.headers.get('Accept')):
+        return jsonify(result)
+    payload = detection_codec.encode(result["detections"],
+                                     processing_time=result["processing_time"],
+                                     input_size=result["input_size"])
+    return Response(payload, mimetype=detection_codec.MEDIA_TYPE)
+
+def run_pipeline(source, batch=False):
+    """Submit a frame source to the inference pipeline and build the HTTP response."""
+    if pipeline is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    try:
+        params = job_params(batch=batch, class_filter=request_class_filter(),
+                            input_size=request_input_size(), roi=request_roi(),
+                            **request_priority())
+        key = None
+        if result_cache is not None:
+            t0 = time.perf_counter()
+            # X-Frame-Id, or the camera's X-Timestamp as forwarded by detection_server
+            frame_id = request.headers.get('X-Frame-Id') or request.headers.get('X-Timestamp')
+            identity = frame_identity(source, frame_id)
+            if identity is not None:
+                class_filter = params["class_filter"]
+                key = (identity, batch, params["input_size"],
+                       None if class_filter is None else tuple(class_filter.tolist()),
+                       None if params["roi"] is None else tuple(params["roi"]))
+                cached = result_cache.get(key)
+                if cached is not None:
+                    response = detection_response(dict(cached, cached=True), batch)
+                    response.headers["Server-Timing"] = server_timing_header(
+                        {"cache": (time.perf_counter() - t0) * 1000.0})
+                    return response
+        result, timings = pipeline.submit(source, params)
+        if key is not None:
+            result_cache.put(key, result)
+        if not batch:
+            pipeline.sizer.record(params["input_size"], timings["forward"])
+        response = detection_response(result, batch)
+        response.headers["Server-Timing"] = server_timing_header(timings)
+        return response
+    except queue.Full:
+        return jsonify({"error": "Inference queue full"}), 503
+    except WorkerUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Superseded as e:
+        return jsonify({"error": str(e)}), 409
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+def load_frames(source):
+    """Turn a frame source into a list of BGR frames.
+
+    Sources are plain picklable tuples so they can cross process boundaries:
+      ("jpeg", [(name, bytes), ...])
+      ("raw", bytes, width, height)
+      ("shm", name, shape, offset)
+      ("array", [ndarray, ...])
+    """
+    kind = source[0]
+    if kind == "jpeg":
+        return [decode_jpeg(data, name) for name, data in source[1]]
+    if kind == "raw":
+        _, data, width, height = source
+        img = decode_raw_frame(data, width, height)
+        if img is None:
+            raise FrameError("Body size does not match frame shape")
+        return [img]
+    if kind == "shm":
+        _, name, shape, offset = source
+        try:
+            return [read_shm_frame(name, shape, offset)]
+        except (OSError, ValueError) as e:
+            raise FrameError(f"Cannot map shared memory: {e}")
+    if kind == "array":
+        return source[1]
+    raise ValueError(f"Unknown frame source: {kind}")
+
+def decode_jpeg(data, name="image"):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise FrameError(f"Invalid image file: {name}")
+    return img
+
+def decode_raw_frame(data, width, height):
+    """View raw BGR bytes as an (height, width, 3) array; None on size mismatch."""
+    if width <= 0 or height <= 0 or len(data) != width * height * 3:
+        return None
+    return np.frombuffer(data, np.uint8).reshape(height, width, 3)
+
+def read_shm_frame(name, shape, offset=0):
+    """Map a frame stored in a named shared-memory segment without copying.
+
+    Opens /dev/shm/<name> directly, so it also works on Python versions that
+    predate multiprocessing.shared_memory.
+    """
+    if not name or os.sep in name or name.startswith('.'):
+        raise ValueError(f"Invalid shared memory name: {name!r}")
+    path = os.path.join(SHM_DIR, name)
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=tuple(shape))
+
+# name -> FrameRingReader, per process (pool workers map their own)
+frame_rings = {}
+frame_rings_lock = threading.Lock()
+
+def ring_reader(name):
+    with frame_rings_lock:
+        reader = frame_rings.get(name)
+        if reader is None:
+            try:
+                reader = frame_rings[name] = frame_ring.FrameRingReader(name, SHM_DIR)
+            except ValueError as e:
+                raise RequestError(str(e))
+    return reader
+
+def ring_frame_source(name, seq):
+    """Copy frame seq out of a camera_server frame ring into an "array" frame source.
+
+    Copied in the request thread, before admission: the ring only holds a
+    few frames (4 slots, ~66 ms at 60 fps), less than a job can spend in
+    the admission queue behind bulk work, so the slot would be overwritten
+    by the time preprocessing read it.
+    """
+    reader = ring_reader(name)
+    frame = reader.get(seq)
+    if frame is None:
+        if not reader.available():
+            raise RingUnavailable(f"Cannot map frame ring {name!r} from {SHM_DIR}")
+        raise FrameError(f"Frame {seq} is not in ring {name!r} (not published or overwritten)")
+    color = frame.color.copy()
+    if not reader.intact(frame):
+        raise FrameError(f"Frame {seq} was overwritten while it was copied")
+    return ("array", [color])
+
 @app.route('/detect/', methods=['POST'])
 def detect_objects():
     try:
-        global request_counter, net, class_list
-        request_counter += 1
-        
         # Check if file exists in request
         if 'file' not in request.files:
             return jsonify({"error": "No file in request"}), 400
         
         file = request.files['file']
         
-        # Read and validate the uploaded image
+        # Decoded and validated in the pipeline's preprocess stage
         file_bytes = file.read()
-        nparr = np.frombuffer(file_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None:
-            return jsonify({"error": "Invalid image file"}), 400
-        
-        logger.info(f"[{request_counter}] Processing image of shape {img.shape}")
-        
-        # Process with YOLO
-        start_time = time.time()
-        
-        # Format image for YOLO
-        input_image = format_yolov5(img)
-        
-        # Run detection
-        outputs = detect(input_image, net)
-        
-        # Process results
-        class_ids, confidences, boxes = wrap_detection(input_image, outputs[0])
-        
-        # Prepare response
-        detections = []
-        for class_id, confidence, box in zip(class_ids, confidences, boxes):
-            detections.append({
-                "label": class_list[class_id],
-                "confidence": float(confidence),
-                "bbox": box  # [x, y, width, height]
-            })
-        
-        process_time = time.time() - start_time
-        logger.info(f"Detection completed in {process_time:.3f} seconds, found {len(detections)} objects")
-        
-        return jsonify({
-            "detections": detections,
-            "processing_time": process_time
-        })
+        return run_pipeline(("jpeg", [(file.filename or "image", file_bytes)]))
         
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/detect/raw', methods=['POST'])
+def detect_objects_raw():
+    """Detect objects in a raw BGR frame (request body) — no JPEG decode.
+
+    Frame geometry comes from the X-Width and X-Height headers.
+    """
+    try:
+        try:
+            width = int(request.headers['X-Width'])
+            height = int(request.headers['X-Height'])
+        except (KeyError, ValueError):
+            return jsonify({"error": "X-Width and X-Height headers are required"}), 400
+
+        data = request.get_data()
+        if width <= 0 or height <= 0 or len(data) != width * height * 3:
+            return jsonify({"error": "Body size does not match frame shape"}), 400
+
+        return run_pipeline(("raw", data, width, height))
+
+    except Exception as e:
+        logger.error(f"Error processing raw frame: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/detect/shm', methods=['POST'])
+def detect_objects_shm():
+    """Detect objects in a frame held in shared memory.
+
+    JSON body: {"name": <segment name>, "shape": [h, w, 3], "offset": <bytes>}
+    or, for camera_server's frame ring, {"ring": <ring name>, "seq": <frame seq>}.
+    A ring frame is copied out of the ring before the job is queued; one
+    that is no longer in the ring is a 400, a ring this host cannot map at
+    all is a 404, so the caller can send frames over HTTP.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        if 'ring' in body:
+            try:
+                seq = int(body['seq'])
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "seq is required with ring"}), 400
+            try:
+                source = ring_frame_source(str(body['ring']), seq)
+            except RingUnavailable as e:
+                return jsonify({"error": str(e)}), 404
+            except RequestError as e:
+                return jsonify({"error": str(e)}), 400
+            return run_pipeline(source)
+        name = body.get('name')
+        shape = body.get('shape')
+        if not name or not shape or len(shape) != 3 or shape[2] != 3:
+            return jsonify({"error": "name and shape [h, w, 3] are required"}), 400
+
+        return run_pipeline(("shm", name, [int(v) for v in shape], int(body.get('offset', 0))))
+
+    except Exception as e:
+        logger.error(f"Error processing shared memory frame: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_objects_batch():
+    """Detect objects in N images (multipart field 'files') with one forward pass."""
+    try:
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({"error": "No files in request"}), 400
+        if len(files) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} files per batch"}), 413
+
+        uploads = [(file.filename, file.read()) for file in files]
+        return run_pipeline(("jpeg", uploads), batch=True)
+
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == "__main__":
-    # Load the model right away instead of waiting for first request
-    logger.info("Loading YOLO model...")
-    start_time = time.time()
-    net = build_model(is_cuda)
-    class_list = load_classes()
-    logger.info(f"Model loaded in {time.time() - start_time:.2f} seconds")
-    
+    parser = argparse.ArgumentParser(description="YOLOv5 detection server")
+    parser.add_argument("device", nargs="?", choices=["cuda", "cpu"], default="cuda",
+                        help="OpenCV DNN target (default: cuda)")
+    parser.add_argument("--engine", choices=["opencv", "onnxruntime"], default="opencv",
+                        help="Inference backend (default: opencv)")
+    parser.add_argument("--model", type=str, default=MODEL_PATH)
+    parser.add_argument("--intra-op-threads", type=int, default=0,
+                        help="ONNX Runtime intra-op threads (default: runtime default)")
+    parser.add_argument("--inter-op-threads", type=int, default=0,
+                        help="ONNX Runtime inter-op threads (default: runtime default)")
+    parser.add_argument("--size-model", action="append", default=[], metavar="SIZE=PATH",
+                        help="Extra model exported for a SIZE x SIZE input, selectable per "
+                             "request with ?size=SIZE (repeatable), e.g. 320=config_files/yolov5s-320.onnx")
+    parser.add_argument("--dynamic-sizes", type=str, default="",
+                        help="Comma-separated extra input sizes served by --model itself "
+                             "(needs a dynamic-shape export), e.g. 320,416")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Default forward-time budget: pick the largest input size "
+                             "expected to fit when a request sends neither size nor budget_ms")
+    parser.add_argument("--cache-size", type=int, default=RESULT_CACHE_SIZE,
+                        help="Responses cached for repeated frames, keyed by X-Frame-Id / "
+                             f"X-Timestamp or a hash of the upload (0 disables, default: {RESULT_CACHE_SIZE})")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Serve from N worker processes, each with its own model "
+                             "(CPU machines; default: single in-process pipeline)")
+    parser.add_argument("--threads-per-worker", type=int, default=0,
+                        help="Inference threads per worker process (default: usable cores / workers)")
+    parser.add_argument("--target-classes", action="store_true",
+                        help="Only report classes listed in targets.yaml unless a request "
+                             "passes ?classes= (use ?classes=all for unfiltered)")
+    cli_args = parser.parse_args()
+    engine_options.update(
+        engine=cli_args.engine,
+        device=cli_args.device,
+        model=cli_args.model,
+        intra_op_threads=cli_args.intra_op_threads,
+        inter_op_threads=cli_args.inter_op_threads,
+        size_models={int(spec.split("=", 1)[0]): spec.split("=", 1)[1] for spec in cli_args.size_model},
+        dynamic_sizes=[int(size) for size in cli_args.dynamic_sizes.split(",") if size],
+    )
+    default_latency_budget = cli_args.latency_budget_ms
+    if cli_args.cache_size > 0:
+        result_cache = ResultCache(cli_args.cache_size)
+
+    # Load and warm up in the background so /ready answers (with progress) from the start
+    threading.Thread(target=startup, name="startup", daemon=True,
+                     args=(cli_args.workers, cli_args.threads_per_worker,
+                           cli_args.target_classes)).start()
+
     # Run the Flask server
     app.run(host="0.0.0.0", port=8765, threaded=True)
\ No newline at end of file
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Test realtime /detect/shm ring requests while bulk traffic keeps YOLO busy.
+
+Self-contained: no camera, model or running servers needed. A
+FrameRingWriter publishes synthetic frames at 60 fps like camera_server,
+yolo_server's InferencePipeline runs a fake engine with a fixed forward
+time, bulk clients keep /detect/raw saturated, and one realtime client
+sends the newest ring frame the way detection_server does.
+
+Every realtime ring request must come back 200: the ring only holds
+~66 ms of frames, so YOLO has to copy the slot before the job waits
+behind bulk work. Exits 1 otherwise.
+
+Usage:
+    python3.8 test_ring_load.py
+    python3.8 test_ring_load.py --forward-ms 100 --bulk-clients 4 --requests 40
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'client'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import argparse
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+import frame_ring
+import yolo_server
+
+RING_NAME = f"test_ring_load_{os.getpid()}"
+FRAME_SHAPE = (480, 848, 3)
+DEPTH_SHAPE = (240, 424)
+CAMERA_FPS = 60
+
+
+class SlowEngine(yolo_server.InferenceEngine):
+    """Sleeps forward_ms per forward and finds nothing."""
+
+    name = "slow"
+
+    def __init__(self, forward_ms):
+        self.forward_s = forward_ms / 1000.0
+
+    def infer(self, blob):
+        time.sleep(self.forward_s)
+        return np.zeros((len(blob), 100, 85), np.float32)
+
+
+def publish_frames(writer, stop):
+    """camera_server stand-in: a new frame in the ring every 1/CAMERA_FPS s."""
+    color = np.zeros(FRAME_SHAPE, np.uint8)
+    depth = np.zeros(DEPTH_SHAPE, np.uint16)
+    while not stop.is_set():
+        writer.publish(color, depth, f"{time.time():.6f}")
+        time.sleep(1.0 / CAMERA_FPS)
+
+
+def bulk_client(index, stop, statuses):
+    client = yolo_server.app.test_client()
+    frame = np.zeros(FRAME_SHAPE, np.uint8).tobytes()
+    n = 0
+    while not stop.is_set():
+        n += 1
+        resp = client.post('/detect/raw', data=frame,
+                           headers={'X-Width': str(FRAME_SHAPE[1]), 'X-Height': str(FRAME_SHAPE[0]),
+                                    'X-Priority': 'bulk', 'X-Client-Id': f"bulk{index}",
+                                    'X-Frame-Id': f"bulk{index}-{n}"})
+        statuses[resp.status_code] += 1
+        if resp.status_code == 503:
+            time.sleep(0.01)  # queue full: back off like a real client would
+
+
+def test_ring_requests_under_bulk_load(forward_ms=100.0, bulk_clients=4, requests=40):
+    """Realtime ring requests all succeed while bulk clients saturate the pipeline."""
+    yolo_server.class_list = [f"class{i}" for i in range(80)]
+    yolo_server.engines = {yolo_server.INPUT_WIDTH: SlowEngine(forward_ms)}
+    yolo_server.pipeline = yolo_server.InferencePipeline(yolo_server.engines)
+
+    writer = frame_ring.FrameRingWriter(RING_NAME, FRAME_SHAPE, DEPTH_SHAPE)
+    stop = threading.Event()
+    bulk_statuses = collections.Counter()
+    threads = [threading.Thread(target=publish_frames, args=(writer, stop), daemon=True)]
+    threads += [threading.Thread(target=bulk_client, args=(i, stop, bulk_statuses), daemon=True)
+                for i in range(bulk_clients)]
+    statuses = collections.Counter()
+    latencies = []
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(4 * forward_ms / 1000.0)  # let bulk work fill the pipeline
+        reader = frame_ring.FrameRingReader(RING_NAME)
+        client = yolo_server.app.test_client()
+        for _ in range(requests):
+            frame = reader.latest()
+            t0 = time.perf_counter()
+            resp = client.post('/detect/shm', json={'ring': RING_NAME, 'seq': frame.seq},
+                               headers={'X-Priority': 'realtime', 'X-Client-Id': 'detection_server',
+                                        'X-Timestamp': frame.timestamp})
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            statuses[resp.status_code] += 1
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        writer.close()
+
+    print(f"forward {forward_ms:.0f} ms, {bulk_clients} bulk clients "
+          f"(bulk responses {dict(bulk_statuses)})")
+    print(f"realtime ring requests: {dict(statuses)}, latency p50 "
+          f"{np.percentile(latencies, 50):.0f} ms, max {max(latencies):.0f} ms")
+    assert bulk_statuses[200] > 0, "bulk clients never got through"
+    assert statuses[200] == requests, f"realtime ring requests failed: {dict(statuses)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test realtime ring requests under bulk load')
+    parser.add_argument('--forward-ms', type=float, default=100.0,
+                        help='Fake engine forward time (default: 100)')
+    parser.add_argument('--bulk-clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=40,
+                        help='Realtime ring requests to send (default: 40)')
+    args = parser.parse_args()
+
+    logging.getLogger('yolo_server').setLevel(logging.WARNING)
+    try:
+        test_ring_requests_under_bulk_load(args.forward_ms, args.bulk_clients, args.requests)
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()